@@ -0,0 +1,38 @@
+from pathlib import Path
+from typing import Iterator
+
+import torch
+from torchaudio.io import StreamReader
+
+
+class AudioReader:
+    """Decode an audio file in fixed-size windows, downmixed to mono and resampled on the fly.
+
+    Only one window is held in memory at a time, so long uploads never
+    materialize as a single waveform.
+    """
+
+    def __init__(self, audio_path: str | Path, sample_rate: int, window_duration: float):
+        self.sample_rate = sample_rate
+        self.samples_read = 0
+
+        self._reader = StreamReader(str(audio_path))
+        info = self._reader.get_src_stream_info(self._reader.default_audio_stream)
+        # Container metadata, may be missing (0) for some formats
+        self.expected_samples = int(info.num_frames * sample_rate / info.sample_rate) if info.num_frames else None
+
+        self._reader.add_basic_audio_stream(
+            frames_per_chunk=int(window_duration * sample_rate),
+            sample_rate=sample_rate,
+            num_channels=1
+        )
+
+    @property
+    def duration(self) -> float:
+        return self.samples_read / self.sample_rate
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        for (chunk,) in self._reader.stream():
+            window = chunk[:, 0]
+            self.samples_read += window.shape[0]
+            yield window
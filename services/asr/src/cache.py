@@ -0,0 +1,155 @@
+import json
+import time
+import asyncio
+import hashlib
+
+from .config import settings
+
+
+# Bump when the stored result format or transcription code changes what a cached entry means
+CACHE_VERSION = 1
+
+
+def config_fingerprint() -> str:
+    """Hash of every setting that changes the transcript for the same audio."""
+    config = {
+        "version": CACHE_VERSION,
+        "model_type": settings.model_type,
+        "backend": settings.backend,
+        "vad_threshold": settings.vad_threshold,
+        "min_silence_duration_ms": settings.min_silence_duration_ms,
+        "min_speech_duration_ms": settings.min_speech_duration_ms,
+        "vad_block_duration": settings.vad_block_duration,  # each block starts from a fresh VAD state
+        "sample_rate": settings.sample_rate,
+        "max_chunk_duration": settings.max_chunk_duration,
+        "max_gap_duration": settings.max_gap_duration,
+        "short_audio_threshold": settings.short_audio_threshold,
+    }
+    if settings.word_timestamps:
+        config["word_timestamps"] = True
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _key(audio_hash: str, fingerprint: str | None = None) -> str:
+    return f"{settings.redis_cache_prefix}result:{audio_hash}:{fingerprint or config_fingerprint()}"
+
+
+def _fingerprint_key() -> str:
+    return f"{settings.redis_cache_prefix}fingerprint"
+
+
+async def publish_fingerprint(redis):
+    """Workers write results under their own settings; the API looks them up under the same ones."""
+    await redis.set(_fingerprint_key(), config_fingerprint())
+
+
+def _index_key() -> str:
+    return f"{settings.redis_cache_prefix}index"
+
+
+async def get_results(redis, audio_hashes: list[str]) -> list[dict | None]:
+    """Cached results in the order asked, in one MGET and one stats pipeline.
+
+    Keys use the fingerprint the workers published, as the API's own
+    environment need not match theirs; none published means no hits.
+    """
+    if not settings.cache_enabled or not audio_hashes:
+        return [None] * len(audio_hashes)
+    fingerprint = await redis.get(_fingerprint_key())
+    keys = [_key(h, fingerprint.decode()) for h in audio_hashes] if fingerprint else []
+    values = await redis.mget(keys) if keys else [None] * len(audio_hashes)
+    hits = [key for key, data in zip(keys, values) if data is not None]
+    async with redis.pipeline(transaction=False) as pipe:
+        if hits:
+            pipe.incrby(f"{settings.redis_cache_prefix}hits", len(hits))
+            pipe.zadd(_index_key(), dict.fromkeys(hits, time.time()))  # LRU touch
+        if len(hits) < len(audio_hashes):
+            pipe.incrby(f"{settings.redis_cache_prefix}misses", len(audio_hashes) - len(hits))
+        await pipe.execute()
+    return [json.loads(data) if data is not None else None for data in values]
+
+
+async def put_result(redis, audio_hash: str, result: dict):
+    if not settings.cache_enabled:
+        return
+    key = _key(audio_hash)
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps(result), ex=settings.cache_ttl)
+        pipe.zadd(_index_key(), {key: now})
+        # Entries past their TTL are already gone from Redis
+        pipe.zremrangebyscore(_index_key(), "-inf", now - settings.cache_ttl)
+        pipe.zcard(_index_key())
+        *_, size = await pipe.execute()
+
+    if size > settings.cache_max_entries:
+        evicted = await redis.zpopmin(_index_key(), size - settings.cache_max_entries)
+        if evicted:
+            await redis.delete(*(k for k, _ in evicted))
+
+
+async def stats(redis) -> dict:
+    hits, misses = await redis.mget(f"{settings.redis_cache_prefix}hits", f"{settings.redis_cache_prefix}misses")
+    hits, misses = int(hits or 0), int(misses or 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "entries": await redis.zcard(_index_key()),
+    }
+
+
+def _chunks_key(audio_hash: str) -> str:
+    return f"{settings.redis_cache_prefix}chunks:{audio_hash}:{config_fingerprint()}"
+
+
+async def get_chunks(redis, audio_hash: str) -> dict[tuple[int, int], tuple[str, list[dict] | None]]:
+    """(text, words) per chunk; words are stored as JSON only when word_timestamps is on."""
+    fields = await redis.hgetall(_chunks_key(audio_hash))
+    chunks = {}
+    for field, value in fields.items():
+        start, end = field.decode().split(":")
+        if settings.word_timestamps:
+            chunks[(int(start), int(end))] = tuple(json.loads(value))
+        else:
+            chunks[(int(start), int(end))] = (value.decode(), None)
+    return chunks
+
+
+async def put_chunks(redis, audio_hash: str, chunks: list[tuple[int, int, str, list[dict] | None]]):
+    key = _chunks_key(audio_hash)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping={
+            f"{start}:{end}": json.dumps([text, words]) if settings.word_timestamps else text
+            for start, end, text, words in chunks
+        })
+        pipe.expire(key, settings.cache_ttl)
+        await pipe.execute()
+
+
+async def drop_chunks(redis, audio_hash: str):
+    await redis.delete(_chunks_key(audio_hash))
+
+
+class ChunkCheckpoint:
+    """Per-chunk transcripts of one audio file, so an interrupted job resumes where it stopped.
+
+    Loaded once before transcription; `put` is called from the inference
+    thread and writes back to Redis on the worker's event loop.
+    """
+
+    def __init__(self, redis, audio_hash: str, done: dict[tuple[int, int], tuple], loop: asyncio.AbstractEventLoop):
+        self.redis = redis
+        self.audio_hash = audio_hash
+        self.done = done
+        self.loop = loop
+
+    @classmethod
+    async def load(cls, redis, audio_hash: str) -> "ChunkCheckpoint":
+        return cls(redis, audio_hash, await get_chunks(redis, audio_hash), asyncio.get_running_loop())
+
+    def get(self, start: int, end: int) -> tuple[str, list[dict] | None] | None:
+        return self.done.get((start, end))
+
+    def put(self, chunks: list[tuple[int, int, str, list[dict] | None]]):
+        asyncio.run_coroutine_threadsafe(put_chunks(self.redis, self.audio_hash, chunks), self.loop)
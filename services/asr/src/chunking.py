@@ -0,0 +1,124 @@
+import torch
+
+from .config import settings
+from .vad import FRAME, ChunkMerger, SpeechDetector
+
+
+@torch.inference_mode()
+def speech_probs(vad_model, audio: torch.Tensor, sr: int, keep_state: bool = False) -> torch.Tensor:
+    """Silero probability for every frame of `audio`, the last one zero-padded.
+
+    The audio is cut into rows of vad_block_duration that run side by side
+    as one batch, so the model steps once per row frame instead of once
+    per audio frame. Each row starts from a fresh model state.
+
+    With `keep_state` the frames run in one row continuing the model's
+    state from the previous call, for live streams fed a little at a time;
+    the model must then not be shared with other audio.
+    """
+    frames = -(-audio.shape[0] // FRAME)
+    if keep_state:
+        row = frames
+    else:
+        row = min(frames, max(1, int(settings.vad_block_duration * sr) // FRAME))
+        vad_model.reset_states()
+    rows = -(-frames // row)
+    x = torch.nn.functional.pad(audio, (0, rows * row * FRAME - audio.shape[0])).view(rows, row, FRAME)
+
+    probs = torch.empty(rows, row)
+    for t in range(row):
+        probs[:, t] = vad_model(x[:, t], sr).flatten()
+    if not keep_state:
+        vad_model.reset_states()
+    return probs.flatten()[:frames]
+
+
+class SpeechChunker:
+    """Run Silero VAD over audio windows as they arrive and emit merged speech chunks.
+
+    Only audio from the oldest chunk that may still be emitted is kept in memory.
+    The probability track is kept whole (one byte per frame) so it can be
+    stored with the job and re-thresholded later without the model.
+    """
+
+    def __init__(self, vad_model, sr: int, streaming: bool = False):
+        self.vad_model = vad_model
+        self.sr = sr
+        self.streaming = streaming  # see speech_probs(keep_state)
+        self.detector = SpeechDetector(sr)
+        self.merger = ChunkMerger(sr)
+        self.margin = sr  # VAD may place a start slightly behind its current position
+        self.probs: list[torch.Tensor] = []
+
+        self.buffer = torch.zeros(0)
+        self.offset = 0  # absolute sample index of buffer[0]
+
+    @property
+    def position(self) -> int:
+        """Samples consumed by VAD."""
+        return self.detector.position
+
+    @property
+    def track(self) -> bytes:
+        probs = torch.cat(self.probs) if self.probs else torch.zeros(0)
+        return (probs * 255).round().to(torch.uint8).numpy().tobytes()
+
+    @property
+    def _buffer_end(self) -> int:
+        return self.offset + self.buffer.shape[0]
+
+    def _detect(self, audio: torch.Tensor) -> list[tuple[int, int]]:
+        probs = speech_probs(self.vad_model, audio, self.sr, keep_state=self.streaming)
+        self.probs.append(probs)
+        return [ts for ts in map(self.detector.push, probs.tolist()) if ts]
+
+    def pending(self) -> tuple[int, int, torch.Tensor] | None:
+        """The chunk still open, up to the audio seen so far."""
+        starts = [s for s in (self.merger.start, self.detector.speech_start) if s is not None]
+        if not starts:
+            return None
+        start = min(starts)
+        return start, self.position, self.buffer[start - self.offset:self.position - self.offset].clone()
+
+    def _emit(self, timestamps: list[tuple[int, int]], final: bool = False) -> list[tuple[int, int, torch.Tensor]]:
+        closed = [self.merger.push(start, end) for start, end in timestamps]
+        speech_start = self.detector.speech_start
+        if final:
+            closed.append(self.merger.flush())
+        else:
+            lower = speech_start if speech_start is not None else self.position - self.margin
+            closed.append(self.merger.close_before(lower))
+
+        chunks = []
+        for start, end in filter(None, closed):
+            end = min(end, self._buffer_end)
+            chunks.append((start, end, self.buffer[start - self.offset:end - self.offset].clone()))
+
+        # Drop audio no future chunk can reach
+        keep = [self.position - self.margin]
+        if speech_start is not None:
+            keep.append(speech_start)
+        if self.merger.start is not None:
+            keep.append(self.merger.start)
+        keep_from = max(self.offset, min(keep))
+        self.buffer = self.buffer[keep_from - self.offset:]
+        self.offset = keep_from
+        return chunks
+
+    def feed(self, window: torch.Tensor) -> list[tuple[int, int, torch.Tensor]]:
+        self.buffer = torch.cat([self.buffer, window])
+        frames = (self._buffer_end - self.position) // FRAME
+        if not frames:
+            return []
+        start = self.position - self.offset
+        return self._emit(self._detect(self.buffer[start:start + frames * FRAME]))
+
+    def flush(self) -> list[tuple[int, int, torch.Tensor]]:
+        total = self._buffer_end
+        timestamps = []
+        tail = self.buffer[self.position - self.offset:]
+        if tail.shape[0]:
+            timestamps.extend(self._detect(tail))
+        timestamps.append(self.detector.flush(total))
+        timestamps = [(start, min(end, total)) for start, end in filter(None, timestamps) if start < total]
+        return self._emit(timestamps, final=True)
@@ -0,0 +1,46 @@
+import httpx
+from redis import asyncio as aioredis
+
+from .config import settings
+
+
+# Created on first use and shared by everything in the process
+_redis: aioredis.Redis | None = None
+_http: httpx.AsyncClient | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        # Blocking pool: callers wait for a free connection instead of failing when it is exhausted
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=settings.redis_max_connections,
+            health_check_interval=30
+        )
+        _redis = aioredis.Redis(connection_pool=pool)
+    return _redis
+
+
+def get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=settings.webhook_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive
+            )
+        )
+    return _http
+
+
+async def close_clients():
+    global _redis, _http
+    if _redis is not None:
+        await _redis.aclose()
+        await _redis.connection_pool.disconnect()
+        _redis = None
+    if _http is not None:
+        await _http.aclose()
+        _http = None
@@ -5,28 +5,85 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379/0"
+    redis_max_connections: int = 50
     redis_queue_key: str = "asr:queue"
+    redis_notify_key: str = "asr:queue:notify"
     redis_jobs_key: str = "asr:jobs"
+    redis_events_channel: str = "asr:events"
+    redis_cache_prefix: str = "asr:cache:"
+    redis_processing_prefix: str = "asr:processing:"  # + worker id, jobs in flight
+    redis_heartbeat_prefix: str = "asr:heartbeat:"
+    redis_dead_key: str = "asr:dead"
+
+    # Queue lanes
+    lane_weights: dict[str, int] = {"high": 6, "normal": 3, "low": 1}
+    high_lane_max_duration: float = 120.0  # seconds, auto-selected by probed duration
+    low_lane_min_duration: float = 1800.0
+    probe_timeout: float = 10.0  # seconds per ffprobe; on timeout the job goes to the normal lane
+
+    # Reliable queue
+    visibility_timeout: int = 60  # seconds without heartbeat before jobs are requeued
+    reaper_interval: int = 30
+    max_attempts: int = 3
+    model_load_timeout: int = 600  # how long a "loading" worker is reported before it counts as gone
 
     # Model
     model_type: str = "v3_e2e_rnnt"
+    backend: str = "torch"  # torch | torch_int8 | onnx | onnx_int8 (the last three are CPU only)
+    model_fast_load: bool = True  # keep a ready-to-mmap copy of the built model
+    model_cache_dir: Path = Path.home() / ".cache" / "transcribe"
+    model_warmup: bool = True
+    word_timestamps: bool = False  # word times from the RNNT alignment, in the same decoding pass
 
     # VAD
     vad_threshold: float = 0.5
     min_silence_duration_ms: int = 300
+    min_speech_duration_ms: int = 250  # shorter blips are dropped, as silero does
+    vad_block_duration: float = 4.0  # audio per row of a batched VAD pass; rows start from fresh state
 
     # Processing
     sample_rate: int = 16000
     max_chunk_duration: float = 25.0
     max_gap_duration: float = 1.5
     short_audio_threshold: float = 30.0
+    stream_window_duration: float = 30.0  # decode/resample window for streaming ingestion
+
+    # Live streaming (WebSocket served by the worker)
+    stream_port: int = 8002  # 0 disables; with a pool only replica 0 serves it
+    stream_partial_interval: float = 1.0  # seconds of new speech between partial results
+
+    # Batching
+    batch_size: int = 8
+    max_batch_samples: int = 16000 * 120  # padded samples per forward pass
+    pipeline_queue_size: int = 16  # closed chunks buffered between VAD and ASR
+
+    # Scheduler (cross-job micro-batching)
+    scheduler_enabled: bool = False
+    scheduler_max_jobs: int = 16
+    scheduler_max_wait_ms: int = 50
+
+    # Worker pool
+    pool_size: int = 1  # model replicas, one process each
+    pool_threads: int = 0  # torch threads per replica, 0 = torch default
+
+    # Result cache
+    cache_enabled: bool = True
+    cache_ttl: int = 7 * 24 * 3600  # seconds
+    cache_max_entries: int = 10000
 
     # Paths
     upload_dir: Path = Path("uploads")
+    spool_dir: Path = Path("spool")  # server-side files accepted by POST /v1/transcribe/bulk
     db_path: Path = Path("data/jobs.db")
+    upload_chunk_size: int = 1024 * 1024
+    bulk_max_jobs: int = 1000  # files per bulk submission and ids per bulk lookup
+    db_busy_timeout_ms: int = 5000
+    progress_flush_interval: float = 0.5  # seconds between coalesced progress writes
 
     # Webhook
     webhook_timeout: int = 30
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
 
     class Config:
         env_prefix = "ASR_"
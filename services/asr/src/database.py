@@ -1,13 +1,64 @@
 import json
+import base64
+import asyncio
 import aiosqlite
+from contextlib import asynccontextmanager
 from pathlib import Path
 from .config import settings
 from .models import JobState, JobStatus
 
 
+# One long-lived connection per process. sqlite3 keeps its prepared
+# statement cache per connection, so reusing it also reuses statements.
+_conn: aiosqlite.Connection | None = None
+_connect_lock = asyncio.Lock()
+_write_lock = asyncio.Lock()
+
+# Progress ticks waiting to be written in one transaction
+_pending_progress: dict[str, int] = {}
+_flush_task: asyncio.Task | None = None
+
+
+async def _connect() -> aiosqlite.Connection:
+    global _conn
+    if _conn is not None:
+        return _conn
+    async with _connect_lock:
+        if _conn is None:
+            settings.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = await aiosqlite.connect(settings.db_path, cached_statements=256)
+            conn.row_factory = aiosqlite.Row
+            # WAL lets the API read while the worker writes the same file
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            await conn.execute(f"PRAGMA busy_timeout={settings.db_busy_timeout_ms}")
+            _conn = conn
+    return _conn
+
+
+@asynccontextmanager
+async def _write():
+    """Serialize write transactions on the shared connection."""
+    db = await _connect()
+    async with _write_lock:
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+
+async def close_db():
+    global _conn
+    await flush_progress()
+    if _conn is not None:
+        await _conn.close()
+        _conn = None
+
+
 async def init_db():
-    settings.db_path.parent.mkdir(parents=True, exist_ok=True)
-    async with aiosqlite.connect(settings.db_path) as db:
+    async with _write() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS jobs (
                 job_id TEXT PRIMARY KEY,
@@ -20,21 +71,62 @@ async def init_db():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        await db.commit()
+        # Finished results live in columns (text, duration, segment_count) plus the
+        # segments table; `result` only holds JSON of rows written before that
+        async with db.execute("PRAGMA table_info(jobs)") as cursor:
+            columns = {row["name"] for row in await cursor.fetchall()}
+        for name, type_ in (("text", "TEXT"), ("duration", "REAL"), ("segment_count", "INTEGER")):
+            if name not in columns:
+                await db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {type_}")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                job_id TEXT,
+                idx INTEGER,
+                start REAL,
+                end REAL,
+                text TEXT,
+                PRIMARY KEY (job_id, idx)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS words (
+                job_id TEXT,
+                idx INTEGER,
+                start REAL,
+                end REAL,
+                word TEXT,
+                PRIMARY KEY (job_id, idx)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS vad_tracks (
+                job_id TEXT PRIMARY KEY,
+                sample_rate INTEGER,
+                samples INTEGER,
+                probs BLOB
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at, job_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
 
 
 async def create_job(job_id: str, filename: str) -> JobState:
-    async with aiosqlite.connect(settings.db_path) as db:
-        await db.execute(
+    await create_jobs([(job_id, filename)])
+    return JobState(job_id=job_id, status=JobStatus.pending)
+
+
+async def create_jobs(jobs: list[tuple[str, str]]):
+    """Insert (job_id, filename) rows as pending, all in one transaction."""
+    async with _write() as db:
+        await db.executemany(
             "INSERT INTO jobs (job_id, filename, status) VALUES (?, ?, ?)",
-            (job_id, filename, JobStatus.pending.value)
+            [(job_id, filename, JobStatus.pending.value) for job_id, filename in jobs]
         )
-        await db.commit()
-    return JobState(job_id=job_id, status=JobStatus.pending)
 
 
 async def update_job(job_id: str, status: JobStatus, result: dict | None = None, error: str | None = None, progress: int | None = None):
-    async with aiosqlite.connect(settings.db_path) as db:
+    _pending_progress.pop(job_id, None)
+    async with _write() as db:
         if progress is not None:
             await db.execute(
                 """UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP
@@ -47,39 +139,270 @@ async def update_job(job_id: str, status: JobStatus, result: dict | None = None,
                    WHERE job_id = ?""",
                 (status.value, json.dumps(result) if result else None, error, job_id)
             )
-        await db.commit()
+
+
+async def queue_progress(job_id: str, progress: int):
+    """Record a progress tick; pending ticks are written together every progress_flush_interval."""
+    global _flush_task
+    _pending_progress[job_id] = max(progress, _pending_progress.get(job_id, 0))
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_progress_later())
+
+
+async def _flush_progress_later():
+    await asyncio.sleep(settings.progress_flush_interval)
+    await flush_progress()
+
+
+async def flush_progress():
+    if not _pending_progress:
+        return
+    ticks = list(_pending_progress.items())
+    _pending_progress.clear()
+    async with _write() as db:
+        # Never move a finished job back or a progress bar backwards
+        await db.executemany(
+            """UPDATE jobs SET progress = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE job_id = ? AND status = ? AND progress < ?""",
+            [(progress, job_id, JobStatus.processing.value, progress) for job_id, progress in ticks]
+        )
+
+
+async def append_segments(job_id: str, start_idx: int, segments: list[dict]):
+    async with _write() as db:
+        await db.executemany(
+            "INSERT OR REPLACE INTO segments (job_id, idx, start, end, text) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, start_idx + i, s["start"], s["end"], s["text"]) for i, s in enumerate(segments)]
+        )
+
+
+async def complete_job(job_id: str, result: dict):
+    """Mark job done. Segments go to their own table, text and duration to their columns."""
+    _pending_progress.pop(job_id, None)
+    async with _write() as db:
+        # Segments already streamed by append_segments are left untouched
+        await db.executemany(
+            "INSERT OR IGNORE INTO segments (job_id, idx, start, end, text) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, i, s["start"], s["end"], s["text"]) for i, s in enumerate(result["segments"])]
+        )
+        await db.execute(
+            """UPDATE jobs SET status = ?, progress = 100, result = NULL, error = NULL,
+                   text = ?, duration = ?, segment_count = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE job_id = ?""",
+            (JobStatus.done.value, result["text"], result["duration"], len(result["segments"]), job_id)
+        )
+        if result.get("words"):
+            await db.executemany(
+                "INSERT OR REPLACE INTO words (job_id, idx, start, end, word) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, w["start"], w["end"], w["word"]) for i, w in enumerate(result["words"])]
+            )
+
+
+async def get_segments(
+    job_id: str,
+    after: int = 0,
+    limit: int | None = None,
+    start: float | None = None,
+    end: float | None = None
+) -> list[dict]:
+    """Segments with index >= `after`, in order, optionally only those overlapping [start, end) seconds."""
+    db = await _connect()
+    query = "SELECT start, end, text FROM segments WHERE job_id = ? AND idx >= ?"
+    params = [job_id, after]
+    if start is not None:
+        query += " AND end > ?"
+        params.append(start)
+    if end is not None:
+        query += " AND start < ?"
+        params.append(end)
+    query += " ORDER BY idx"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    async with db.execute(query, params) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def get_words(job_id: str, start: float | None = None, end: float | None = None) -> list[dict]:
+    """Word timestamps in order, optionally only those overlapping [start, end) seconds."""
+    db = await _connect()
+    query = "SELECT start, end, word FROM words WHERE job_id = ?"
+    params = [job_id]
+    if start is not None:
+        query += " AND end > ?"
+        params.append(start)
+    if end is not None:
+        query += " AND start < ?"
+        params.append(end)
+    async with db.execute(query + " ORDER BY idx", params) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def get_job_meta(job_id: str) -> dict | None:
+    """Job fields without text or segments."""
+    db = await _connect()
+    async with db.execute(
+        """SELECT job_id, filename, status, progress, error, duration, segment_count, created_at, updated_at
+           FROM jobs WHERE job_id = ?""",
+        (job_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return dict(row) if row else None
+
+
+async def get_job_text(job_id: str) -> str | None:
+    """Full transcript text only; None if the job is unknown or unfinished."""
+    db = await _connect()
+    async with db.execute("SELECT text, result FROM jobs WHERE job_id = ?", (job_id,)) as cursor:
+        row = await cursor.fetchone()
+    if not row:
+        return None
+    if row["text"] is not None:
+        return row["text"]
+    return json.loads(row["result"])["text"] if row["result"] else None
+
+
+async def save_vad_track(job_id: str, sample_rate: int, samples: int, probs: bytes):
+    async with _write() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO vad_tracks (job_id, sample_rate, samples, probs) VALUES (?, ?, ?, ?)",
+            (job_id, sample_rate, samples, probs)
+        )
+
+
+async def get_vad_track(job_id: str) -> dict | None:
+    """Speech probability per VAD frame, one byte each, as stored by the worker."""
+    db = await _connect()
+    async with db.execute(
+        "SELECT sample_rate, samples, probs FROM vad_tracks WHERE job_id = ?", (job_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return dict(row) if row else None
 
 
 async def get_job(job_id: str) -> JobState | None:
-    async with aiosqlite.connect(settings.db_path) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                return None
-            return _row_to_job(row)
+    db = await _connect()
+    async with db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            return None
+    return _row_to_job(row, await get_segments(job_id), await get_words(job_id))
+
+
+def encode_cursor(created_at: str, job_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{job_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """(created_at, job_id) of the last job of the previous page; ValueError if malformed."""
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return created_at, job_id
+
+
+def _job_filter(statuses: list[JobStatus] | None, cursor: str | None = None) -> tuple[str, list]:
+    clauses, params = [], []
+    if statuses:
+        clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(s.value for s in statuses)
+    if cursor:
+        # Keyset pagination: strictly older than the cursor job
+        clauses.append("(created_at, job_id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+async def get_all_jobs(
+    limit: int | None = None,
+    cursor: str | None = None,
+    statuses: list[JobStatus] | None = None,
+    summary: bool = False
+) -> tuple[list[JobState], str | None]:
+    """Jobs newest first, and the cursor of the next page if `limit` was reached.
+
+    `cursor` comes from the previous page; `summary` skips results.
+    """
+    db = await _connect()
+    where, params = _job_filter(statuses, cursor)
+    columns = "job_id, filename, status, progress, error, created_at" + ("" if summary else ", result, text, duration")
+    query = f"SELECT {columns} FROM jobs{where} ORDER BY created_at DESC, job_id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    async with db.execute(query, params) as cursor_:
+        rows = await cursor_.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["job_id"])
+    return await _rows_to_jobs(db, rows, summary), next_cursor
+
+
+async def get_jobs(job_ids: list[str], summary: bool = False) -> list[JobState]:
+    """Jobs by id in the order given; unknown ids are skipped."""
+    db = await _connect()
+    columns = "job_id, filename, status, progress, error" + ("" if summary else ", result, text, duration")
+    rows = {}
+    # Stay well under SQLite's bound-parameter limit
+    for i in range(0, len(job_ids), 500):
+        batch = job_ids[i:i + 500]
+        async with db.execute(
+            f"SELECT {columns} FROM jobs WHERE job_id IN ({', '.join('?' * len(batch))})", batch
+        ) as cursor:
+            for row in await cursor.fetchall():
+                rows[row["job_id"]] = row
+    return await _rows_to_jobs(db, [rows[job_id] for job_id in dict.fromkeys(job_ids) if job_id in rows], summary)
+
+
+async def _rows_to_jobs(db, rows, summary: bool) -> list[JobState]:
+    """Build jobs from rows, loading segments for finished ones in one query per 500 jobs."""
+    if summary:
+        return [_row_to_job(row) for row in rows]
+
+    segments = {}
+    job_ids = [row["job_id"] for row in rows if row["result"] or row["text"] is not None]
+    for i in range(0, len(job_ids), 500):
+        batch = job_ids[i:i + 500]
+        async with db.execute(
+            f"SELECT job_id, start, end, text FROM segments WHERE job_id IN ({', '.join('?' * len(batch))}) ORDER BY job_id, idx",
+            batch
+        ) as cursor:
+            async for r in cursor:
+                segments.setdefault(r["job_id"], []).append({"start": r["start"], "end": r["end"], "text": r["text"]})
+    return [_row_to_job(row, segments.get(row["job_id"], [])) for row in rows]
 
 
-async def get_all_jobs() -> list[JobState]:
-    async with aiosqlite.connect(settings.db_path) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM jobs ORDER BY created_at DESC") as cursor:
-            rows = await cursor.fetchall()
-            return [_row_to_job(row) for row in rows]
+async def count_jobs(statuses: list[JobStatus] | None = None) -> int:
+    db = await _connect()
+    where, params = _job_filter(statuses)
+    async with db.execute(f"SELECT COUNT(*) FROM jobs{where}", params) as cursor:
+        return (await cursor.fetchone())[0]
 
 
 async def delete_job(job_id: str):
-    async with aiosqlite.connect(settings.db_path) as db:
+    async with _write() as db:
         await db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
-        await db.commit()
+        await db.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+        await db.execute("DELETE FROM vad_tracks WHERE job_id = ?", (job_id,))
+        await db.execute("DELETE FROM words WHERE job_id = ?", (job_id,))
 
 
-def _row_to_job(row) -> JobState:
+def _row_to_job(row, segments: list[dict] | None = None, words: list[dict] | None = None) -> JobState:
+    """Words are only loaded for single-job reads; lists leave them out."""
+    keys = row.keys()
+    result = None
+    if "text" in keys and row["text"] is not None:
+        result = {"text": row["text"], "duration": row["duration"], "segments": segments or [], "words": words or None}
+    elif "result" in keys and row["result"]:
+        result = json.loads(row["result"])
+        if "segments" not in result:
+            result["segments"] = segments or []
     return JobState(
         job_id=row["job_id"],
         status=JobStatus(row["status"]),
         progress=row["progress"] or 0,
-        result=json.loads(row["result"]) if row["result"] else None,
+        result=result,
         error=row["error"],
         filename=row["filename"]
     )
@@ -0,0 +1,74 @@
+import json
+import asyncio
+
+from .config import settings
+from .clients import get_redis
+
+
+async def publish(event: dict):
+    """Announce a job change to every API process; best effort, never fails the caller."""
+    try:
+        await get_redis().publish(settings.redis_events_channel, json.dumps(event))
+    except Exception as e:
+        print(f"Event publish failed: {e}")
+
+
+async def publish_many(events: list[dict]):
+    """Like publish, in one pipeline round trip."""
+    if not events:
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.publish(settings.redis_events_channel, json.dumps(event))
+            await pipe.execute()
+    except Exception as e:
+        print(f"Event publish failed: {e}")
+
+
+class JobEventHub:
+    """One Redis subscription per process, fanned out to every connected SSE client."""
+
+    def __init__(self):
+        self.subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1000)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(settings.redis_events_channel)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        event = json.loads(message["data"])
+                        for queue in list(self.subscribers):
+                            if queue.full():
+                                # Slow client: drop its oldest event rather than grow unbounded
+                                queue.get_nowait()
+                            queue.put_nowait(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event subscription lost: {e}")
+                await asyncio.sleep(1)
+
+
+hub = JobEventHub()
@@ -0,0 +1,87 @@
+import json
+
+from .config import settings
+
+
+LANES = ("high", "normal", "low")
+
+
+def lane_key(lane: str) -> str:
+    # "normal" keeps the original key so jobs queued before lanes existed are still served
+    return settings.redis_queue_key if lane == "normal" else f"{settings.redis_queue_key}:{lane}"
+
+
+def choose_lane(duration: float | None, priority: str | None = None) -> str:
+    """Explicit priority wins; otherwise short clips go ahead of long recordings."""
+    if priority:
+        return priority
+    if duration is None:
+        return "normal"
+    if duration <= settings.high_lane_max_duration:
+        return "high"
+    if duration >= settings.low_lane_min_duration:
+        return "low"
+    return "normal"
+
+
+async def enqueue(redis, job_data: dict, front: bool = False):
+    """Queue a job in its lane; `front` puts it next in line (used for requeues)."""
+    await enqueue_many(redis, [job_data], front)
+
+
+async def enqueue_many(redis, jobs: list[dict], front: bool = False):
+    """Queue jobs in their lanes with a single round trip to Redis."""
+    if not jobs:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for job_data in jobs:
+            key = lane_key(job_data.get("lane", "normal"))
+            if front:
+                pipe.rpush(key, json.dumps(job_data))
+            else:
+                pipe.lpush(key, json.dumps(job_data))
+        # Wake idle workers, one token per job; they re-check every lane, so a few stale tokens are harmless
+        pipe.lpush(settings.redis_notify_key, *[1] * min(len(jobs), 100))
+        pipe.ltrim(settings.redis_notify_key, 0, 99)
+        await pipe.execute()
+
+
+async def requeue(redis, job_data: dict, claim_key: str, job_json: bytes):
+    """Put a reaped job next in line and drop its entry from `claim_key`, in one transaction."""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.rpush(lane_key(job_data.get("lane", "normal")), json.dumps(job_data))
+        pipe.lpush(settings.redis_notify_key, 1)
+        pipe.ltrim(settings.redis_notify_key, 0, 99)
+        pipe.lrem(claim_key, 1, job_json)
+        await pipe.execute()
+
+
+class LaneScheduler:
+    """Smooth weighted round-robin over the queue lanes.
+
+    With every lane busy, lanes are served in proportion to lane_weights;
+    an empty lane hands its turn to the next one.
+    """
+
+    def __init__(self):
+        self.weights = {lane: settings.lane_weights.get(lane, 1) for lane in LANES}
+        self.current = dict.fromkeys(LANES, 0)
+
+    def _order(self) -> list[str]:
+        total = sum(self.weights.values())
+        for lane, weight in self.weights.items():
+            self.current[lane] += weight
+        picked = max(LANES, key=lambda lane: self.current[lane])
+        self.current[picked] -= total
+        rest = sorted((lane for lane in LANES if lane != picked), key=lambda lane: -self.weights[lane])
+        return [picked, *rest]
+
+    async def fetch(self, redis, processing_key: str, timeout: float = 0) -> bytes | None:
+        """Move the next job into `processing_key`, waiting up to `timeout` seconds if all lanes are empty."""
+        while True:
+            for lane in self._order():
+                job_json = await redis.lmove(lane_key(lane), processing_key, "RIGHT", "LEFT")
+                if job_json is not None:
+                    return job_json
+            if timeout <= 0 or await redis.brpop(settings.redis_notify_key, timeout=timeout) is None:
+                return None
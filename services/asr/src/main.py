@@ -3,12 +3,18 @@ from fastapi import FastAPI
 
 from .routes import v1
 from . import database as db
+from .events import hub
+from .clients import close_clients
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await db.init_db()
+    hub.start()
     yield
+    await hub.stop()
+    await db.close_db()
+    await close_clients()
 
 
 app = FastAPI(
@@ -15,10 +15,17 @@ class Segment(BaseModel):
     text: str
 
 
+class Word(BaseModel):
+    start: float
+    end: float
+    word: str
+
+
 class TranscribeResult(BaseModel):
     text: str
     segments: list[Segment]
     duration: float
+    words: list[Word] | None = None  # with ASR_WORD_TIMESTAMPS
 
 
 class TranscribeRequest(BaseModel):
@@ -29,6 +36,11 @@ class JobCreate(BaseModel):
     job_id: str
 
 
+class JobLookup(BaseModel):
+    job_ids: list[str]
+    summary: bool = False
+
+
 class JobState(BaseModel):
     job_id: str
     status: JobStatus
@@ -1,75 +1,294 @@
 import json
 import uuid
+import shutil
+import hashlib
 import asyncio
 import aiofiles
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from pathlib import Path
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
-from redis import asyncio as aioredis
 
 from ..config import settings
-from ..models import JobCreate, JobState
+from ..models import JobCreate, JobLookup, JobState, JobStatus, Segment, Word
 from .. import database as db
+from .. import events
+from .. import cache
+from .. import jobqueue
+from .. import vad
+from ..webhook import send_webhook
+from ..clients import get_redis
+from ..events import hub
 
 
 router = APIRouter(prefix="/v1", tags=["v1"])
 settings.upload_dir.mkdir(exist_ok=True)
+_probe_slots = asyncio.Semaphore(16)  # concurrent ffprobe processes during bulk submission
 
 
-async def get_redis():
-    return await aioredis.from_url(settings.redis_url)
+async def save_upload(file: UploadFile, path: Path) -> tuple[int, str]:
+    """Copy an upload to disk in bounded chunks, returning its size and sha256."""
+    size = 0
+    digest = hashlib.sha256()
+    async with aiofiles.open(path, "wb") as f:
+        while chunk := await file.read(settings.upload_chunk_size):
+            size += len(chunk)
+            digest.update(chunk)
+            await f.write(chunk)
+    return size, digest.hexdigest()
+
+
+async def probe_duration(path: Path) -> float | None:
+    """Audio duration from container metadata via ffprobe; None if it can't be read in probe_timeout."""
+    try:
+        async with _probe_slots:
+            proc = await asyncio.create_subprocess_exec(
+                "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path),
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            try:
+                stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=settings.probe_timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                print(f"ffprobe timed out on {path.name}")
+                return None
+        return float(stdout.strip())
+    except (OSError, ValueError):
+        return None
+
+
+def check_priority(priority: str | None):
+    if priority is not None and priority not in jobqueue.LANES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(jobqueue.LANES)}")
+
+
+def hash_file(path: Path) -> tuple[int, str]:
+    """Size and sha256 of a file already on disk, read in bounded chunks."""
+    size = 0
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(settings.upload_chunk_size):
+            size += len(chunk)
+            digest.update(chunk)
+    return size, digest.hexdigest()
+
+
+def spool_file(name: str) -> Path:
+    root = settings.spool_dir.resolve()
+    path = (root / name).resolve()
+    if not path.is_relative_to(root) or not path.is_file():
+        raise HTTPException(status_code=400, detail=f"Not a file in the spool directory: {name}")
+    return path
+
+
+async def queue_jobs(
+    background_tasks: BackgroundTasks,
+    uploads: list[dict],
+    callback_url: str | None = None,
+    priority: str | None = None,
+    stage: str | None = None
+) -> list[JobCreate]:
+    """Create and queue jobs for saved files ({job_id, filename, audio_path, size, audio_hash}).
+
+    Rows are inserted in one transaction, cache lookups, events and queueing
+    take one Redis round trip each; files whose transcript is cached finish right away.
+    """
+    await db.create_jobs([(u["job_id"], u["filename"]) for u in uploads])
+    redis = get_redis()
+
+    # Same audio and settings seen before: finish without queueing.
+    # VAD jobs skip the cache, their result is not a transcript.
+    if stage is None:
+        cached = await cache.get_results(redis, [u["audio_hash"] for u in uploads])
+    else:
+        cached = [None] * len(uploads)
+
+    pending, updates = [], []
+    for u, result in zip(uploads, cached):
+        if result is not None:
+            u["audio_path"].unlink(missing_ok=True)
+            await db.complete_job(u["job_id"], result)
+            updates.append({"type": "job", "job_id": u["job_id"], "status": JobStatus.done.value, "progress": 100})
+            if callback_url:
+                background_tasks.add_task(send_webhook, callback_url, await db.get_job(u["job_id"]))
+        else:
+            updates.append({"type": "job", "job_id": u["job_id"], "status": JobStatus.pending.value, "progress": 0})
+            pending.append(u)
+    await events.publish_many(updates)
+
+    durations = await asyncio.gather(*(probe_duration(u["audio_path"]) for u in pending))
+    jobs = []
+    for u, duration in zip(pending, durations):
+        job_data = {
+            "job_id": u["job_id"],
+            "audio_path": str(u["audio_path"]),
+            "size": u["size"],
+            "duration": duration,
+            "lane": jobqueue.choose_lane(duration, priority),
+            "callback_url": callback_url
+        }
+        if stage is None:
+            job_data["audio_hash"] = u["audio_hash"]
+        else:
+            job_data["stage"] = stage
+        jobs.append(job_data)
+    await jobqueue.enqueue_many(redis, jobs)
+
+    return [JobCreate(job_id=u["job_id"]) for u in uploads]
+
+
+async def receive_upload(file: UploadFile) -> dict:
+    job_id = str(uuid.uuid4())
+    audio_path = settings.upload_dir / f"{job_id}_{file.filename}"
+    size, audio_hash = await save_upload(file, audio_path)
+    return {"job_id": job_id, "filename": file.filename, "audio_path": audio_path, "size": size, "audio_hash": audio_hash}
+
+
+async def receive_spooled(path: Path) -> dict:
+    """Move a spool file into the upload directory, so it is queued exactly once."""
+    job_id = str(uuid.uuid4())
+    audio_path = settings.upload_dir / f"{job_id}_{path.name}"
+    await asyncio.to_thread(shutil.move, path, audio_path)
+    size, audio_hash = await asyncio.to_thread(hash_file, audio_path)
+    return {"job_id": job_id, "filename": path.name, "audio_path": audio_path, "size": size, "audio_hash": audio_hash}
 
 
 @router.post("/transcribe", response_model=JobCreate)
 async def transcribe(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    callback_url: str | None = None
+    callback_url: str | None = None,
+    priority: str | None = None
 ):
-    job_id = str(uuid.uuid4())
-    audio_path = settings.upload_dir / f"{job_id}_{file.filename}"
+    check_priority(priority)
+    upload = await receive_upload(file)
+    (job,) = await queue_jobs(background_tasks, [upload], callback_url, priority)
+    return job
 
-    async with aiofiles.open(audio_path, "wb") as f:
-        content = await file.read()
-        await f.write(content)
 
-    # Save to SQLite
-    await db.create_job(job_id, file.filename)
+@router.post("/transcribe/bulk", response_model=list[JobCreate])
+async def transcribe_bulk(
+    background_tasks: BackgroundTasks,
+    files: list[UploadFile] | None = File(None),
+    paths: list[str] | None = Form(None),
+    callback_url: str | None = None,
+    priority: str | None = None
+):
+    """Submit many files in one call: multipart `files` and/or `paths` of files in the spool directory.
 
-    # Push to Redis queue for worker
-    redis = await get_redis()
-    job_data = {
-        "job_id": job_id,
-        "audio_path": str(audio_path),
-        "callback_url": callback_url
-    }
-    await redis.lpush(settings.redis_queue_key, json.dumps(job_data))
+    Job ids are returned in submission order, uploads first.
+    """
+    check_priority(priority)
+    files, paths = files or [], paths or []
+    if not files and not paths:
+        raise HTTPException(status_code=400, detail="No files or paths given")
+    if len(files) + len(paths) > settings.bulk_max_jobs:
+        raise HTTPException(status_code=400, detail=f"At most {settings.bulk_max_jobs} files per request")
+    spooled = [spool_file(name) for name in paths]  # validate all before touching any
+    if len(set(spooled)) < len(spooled):
+        raise HTTPException(status_code=400, detail="Duplicate paths given")
+
+    uploads = [await receive_upload(file) for file in files]
+    uploads += await asyncio.gather(*(receive_spooled(path) for path in spooled))
+    return await queue_jobs(background_tasks, uploads, callback_url, priority)
+
+
+@router.post("/vad", response_model=JobCreate)
+async def detect_speech(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    callback_url: str | None = None,
+    priority: str | None = None
+):
+    """Queue VAD only: the result holds speech chunks with empty text, and the
+    probability track is stored for GET /jobs/{job_id}/vad."""
+    check_priority(priority)
+    upload = await receive_upload(file)
+    (job,) = await queue_jobs(background_tasks, [upload], callback_url, priority, stage="vad")
+    return job
 
-    return JobCreate(job_id=job_id)
+
+def parse_statuses(status: str | None) -> list[JobStatus] | None:
+    if not status:
+        return None
+    try:
+        return [JobStatus(s.strip()) for s in status.split(",") if s.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown status in: {status}")
 
 
 @router.get("/jobs", response_model=list[JobState])
-async def list_jobs():
-    return await db.get_all_jobs()
+async def list_jobs(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+    status: str | None = None,
+    summary: bool = False
+):
+    """Jobs newest first. Pass the X-Next-Cursor header back as `cursor` for the next page."""
+    try:
+        jobs, next_cursor = await db.get_all_jobs(limit=limit, cursor=cursor, statuses=parse_statuses(status), summary=summary)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return jobs
+
+
+@router.post("/jobs/bulk", response_model=list[JobState])
+async def get_jobs_bulk(lookup: JobLookup):
+    """Several jobs in one round trip, in the order asked; unknown ids are left out."""
+    if len(lookup.job_ids) > settings.bulk_max_jobs:
+        raise HTTPException(status_code=400, detail=f"At most {settings.bulk_max_jobs} ids per request")
+    return await db.get_jobs(lookup.job_ids, summary=lookup.summary)
+
+
+@router.get("/jobs/count")
+async def count_jobs(status: str | None = None):
+    return {"count": await db.count_jobs(parse_statuses(status))}
 
 
 @router.get("/jobs/stream")
 async def stream_jobs():
     """SSE endpoint for job updates"""
     async def event_generator():
-        last_states = {}
-        while True:
-            all_jobs = await db.get_all_jobs()
-            updates = []
-            for job in all_jobs:
-                key = job.job_id
-                state = (job.status, job.progress)
-                if last_states.get(key) != state:
-                    last_states[key] = state
-                    updates.append(job.model_dump())
-
-            if updates:
-                yield f"data: {json.dumps(updates)}\n\n"
-
-            await asyncio.sleep(0.5)
+        queue = hub.subscribe()
+        try:
+            # Snapshot once on connect so reconnecting clients catch up, deltas afterwards
+            all_jobs, _ = await db.get_all_jobs()
+            if all_jobs:
+                yield f"data: {json.dumps([job.model_dump() for job in all_jobs])}\n\n"
+
+            while True:
+                try:
+                    events = [await asyncio.wait_for(queue.get(), timeout=15)]
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+
+                updates = {}
+                for event in events:
+                    if event["type"] == "segments":
+                        payload = {k: event[k] for k in ("job_id", "after", "segments")}
+                        yield f"event: segments\ndata: {json.dumps(payload)}\n\n"
+                    elif event["type"] == "job":
+                        updates[event["job_id"]] = event
+
+                changed = []
+                for job_id, event in updates.items():
+                    if event["status"] == JobStatus.processing.value:
+                        # Progress ticks are the hot path: no DB read needed
+                        changed.append({"job_id": job_id, "status": event["status"], "progress": event["progress"] or 0})
+                    else:
+                        job = await db.get_job(job_id)
+                        if job:
+                            changed.append(job.model_dump())
+                if changed:
+                    yield f"data: {json.dumps(changed)}\n\n"
+        finally:
+            hub.unsubscribe(queue)
 
     return StreamingResponse(
         event_generator(),
@@ -78,6 +297,26 @@ async def stream_jobs():
     )
 
 
+@router.get("/workers")
+async def list_workers():
+    """Live workers from their heartbeats; `ready` counts those with models loaded."""
+    redis = get_redis()
+    keys = [key async for key in redis.scan_iter(match=f"{settings.redis_heartbeat_prefix}*")]
+    values = await redis.mget(keys) if keys else []
+    workers = []
+    for key, value in zip(keys, values):
+        if value is None:
+            continue  # expired between SCAN and MGET
+        status = json.loads(value)
+        workers.append({"id": key.decode()[len(settings.redis_heartbeat_prefix):], **status})
+    return {"workers": workers, "ready": sum(w["state"] == "ready" for w in workers)}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return await cache.stats(get_redis())
+
+
 @router.get("/jobs/{job_id}", response_model=JobState)
 async def get_job(job_id: str):
     job = await db.get_job(job_id)
@@ -86,6 +325,74 @@ async def get_job(job_id: str):
     return job
 
 
+@router.get("/jobs/{job_id}/meta")
+async def get_job_meta(job_id: str):
+    """Status, duration and segment count without loading the transcript."""
+    meta = await db.get_job_meta(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return meta
+
+
+@router.get("/jobs/{job_id}/text")
+async def get_job_text(job_id: str):
+    text = await db.get_job_text(job_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="No transcript for this job")
+    return {"job_id": job_id, "text": text}
+
+
+@router.get("/jobs/{job_id}/segments", response_model=list[Segment])
+async def get_segments(
+    job_id: str,
+    after: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    start: float | None = None,
+    end: float | None = None
+):
+    """Segments decoded so far from index `after`, optionally only those overlapping [start, end) seconds."""
+    if not await db.get_job_meta(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await db.get_segments(job_id, after, limit, start, end)
+
+
+@router.get("/jobs/{job_id}/words", response_model=list[Word])
+async def get_words(job_id: str, start: float | None = None, end: float | None = None):
+    """Word timestamps (with ASR_WORD_TIMESTAMPS), optionally only those overlapping [start, end) seconds."""
+    if not await db.get_job_meta(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await db.get_words(job_id, start, end)
+
+
+@router.get("/jobs/{job_id}/vad")
+async def get_vad(
+    job_id: str,
+    threshold: float | None = Query(None, ge=0, le=1),
+    min_silence_ms: int | None = Query(None, ge=0)
+):
+    """Re-segment the job's stored speech probabilities, optionally with other VAD parameters.
+
+    `speech` are raw VAD ranges and `chunks` the merged ranges ASR would transcribe, in seconds.
+    """
+    track = await db.get_vad_track(job_id)
+    if not track:
+        raise HTTPException(status_code=404, detail="No VAD track for this job")
+    sr = track["sample_rate"]
+
+    def segment() -> tuple[list, list]:
+        # One step per frame in Python: hours of audio would stall the event loop
+        speech = vad.speech_timestamps(vad.unpack(track["probs"]), track["samples"], sr, threshold, min_silence_ms)
+        return speech, vad.merge_chunks(speech, sr)
+
+    speech, chunks = await asyncio.to_thread(segment)
+    return {
+        "threshold": settings.vad_threshold if threshold is None else threshold,
+        "min_silence_ms": settings.min_silence_duration_ms if min_silence_ms is None else min_silence_ms,
+        "speech": [[start / sr, end / sr] for start, end in speech],
+        "chunks": [[start / sr, end / sr] for start, end in chunks],
+    }
+
+
 @router.delete("/jobs/{job_id}")
 async def delete_job(job_id: str):
     await db.delete_job(job_id)
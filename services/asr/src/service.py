@@ -1,120 +1,463 @@
+import os
+import uuid
+import itertools
+import queue
+import threading
+import time
 import torch
-import torchaudio
-import gigaam
 from pathlib import Path
-from silero_vad import load_silero_vad, get_speech_timestamps
+from typing import Iterator
+from silero_vad import load_silero_vad
 
 from .config import settings
-from .models import Segment, TranscribeResult
+from .audio import AudioReader
+from .chunking import SpeechChunker
+from .vad import merge_chunks
+from .models import Segment, TranscribeResult, Word
+from .words import greedy_decode, token_words
+
+
+def _tmp_path(path: Path) -> Path:
+    """Unique sibling to write `path` through, so replicas writing at once never share a file."""
+    return path.with_name(f"{path.stem}.{os.getpid()}.{uuid.uuid4().hex}.tmp{path.suffix}")
+
+
+class TorchBackend:
+    """Encoder forward with the model as loaded."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def encode(self, wav: torch.Tensor, length: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        return self.model.forward(wav, length)
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """Dynamic INT8 quantization of the encoder's Linear layers (CPU only)."""
+
+    def __init__(self, model):
+        model.encoder = torch.ao.quantization.quantize_dynamic(model.encoder, {torch.nn.Linear}, dtype=torch.qint8)
+        super().__init__(model)
+
+
+class OnnxBackend:
+    """Preprocessing in torch, encoder in ONNX Runtime; `quantize` adds dynamic INT8 weights.
+
+    The exported encoder is kept next to the cached model and reused across restarts.
+    Batch and time axes are dynamic; tests/test_backends.py checks that inputs far
+    longer than the export dummy still match the torch encoder.
+    """
+
+    opset = 17
+
+    def __init__(self, model, quantize: bool = False):
+        import onnxruntime as ort
+
+        self.model = model
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(
+            str(self._export(model, quantize)), options, providers=["CPUExecutionProvider"]
+        )
+
+    def _export(self, model, quantize: bool) -> Path:
+        # Opset and torch version in the name: a different exporter never reuses an old file
+        base = f"{settings.model_type}-encoder-opset{self.opset}-torch{torch.__version__}"
+        fp32_path = settings.model_cache_dir / f"{base}.onnx"
+        path = settings.model_cache_dir / f"{base}-int8.onnx" if quantize else fp32_path
+        if path.exists():
+            return path
+        fp32_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Files are written under a unique temp name and renamed into place, so a
+        # crashed export or replicas exporting together never leave a truncated file
+        if not fp32_path.exists():
+            tmp = _tmp_path(fp32_path)
+            try:
+                sr = settings.sample_rate
+                features, feature_lengths = model.preprocessor(torch.zeros(1, sr), torch.tensor([sr]))
+                torch.onnx.export(
+                    model.encoder,
+                    (features, feature_lengths),
+                    str(tmp),
+                    input_names=["features", "feature_lengths"],
+                    output_names=["encoded", "encoded_len"],
+                    dynamic_axes={
+                        "features": {0: "batch", 2: "time"},
+                        "feature_lengths": {0: "batch"},
+                        "encoded": {0: "batch", 2: "frames"},
+                        "encoded_len": {0: "batch"},
+                    },
+                    opset_version=self.opset
+                )
+                tmp.replace(fp32_path)
+            finally:
+                tmp.unlink(missing_ok=True)
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            tmp = _tmp_path(path)
+            try:
+                quantize_dynamic(str(fp32_path), str(tmp), weight_type=QuantType.QInt8)
+                tmp.replace(path)
+            finally:
+                tmp.unlink(missing_ok=True)
+        return path
+
+    def encode(self, wav: torch.Tensor, length: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        features, feature_lengths = self.model.preprocessor(wav, length)
+        encoded, encoded_len = self.session.run(None, {
+            "features": features.numpy(),
+            "feature_lengths": feature_lengths.numpy(),
+        })
+        return torch.from_numpy(encoded), torch.from_numpy(encoded_len)
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "torch_int8": QuantizedTorchBackend,
+    "onnx": OnnxBackend,
+    "onnx_int8": lambda model: OnnxBackend(model, quantize=True),
+}
+CPU_BACKENDS = {"torch_int8", "onnx", "onnx_int8"}
 
 
 class ASRService:
     def __init__(self):
         self.asr_model = None
         self.vad_model = None
+        self.backend = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    def load_models(self):
-        self.asr_model = gigaam.load_model(settings.model_type, device=self.device)
+    def load_models(self) -> float:
+        """Load GigaAM and Silero, returning the cold-start time in seconds."""
+        started = time.perf_counter()
+        if settings.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {settings.backend!r}, expected one of {', '.join(BACKENDS)}")
+        if settings.word_timestamps and "rnnt" not in settings.model_type:
+            raise ValueError(f"Word timestamps need an RNNT model, got model_type {settings.model_type!r}")
+        if settings.backend in CPU_BACKENDS and self.device != "cpu":
+            print(f"Backend {settings.backend} runs on CPU only, ignoring {self.device}")
+            self.device = "cpu"
+        self.asr_model = self._load_asr_model()
+        self.backend = BACKENDS[settings.backend](self.asr_model)
         self.vad_model = load_silero_vad()
+        if settings.model_warmup:
+            self.warmup()
+        return time.perf_counter() - started
+
+    def _load_asr_model(self):
+        # Whole pickled module in the cache volume: mmap'ed on load, no config parsing or
+        # checkpoint re-init (unpickling still imports gigaam for the module classes)
+        cached = settings.model_cache_dir / f"{settings.model_type}-torch{torch.__version__}.pt"
+        if settings.model_fast_load and cached.exists():
+            try:
+                return torch.load(cached, map_location=self.device, mmap=True, weights_only=False)
+            except Exception as e:
+                print(f"Cached model unusable, rebuilding: {e}")
+
+        import gigaam
+        model = gigaam.load_model(settings.model_type, device=self.device)
+        if settings.model_fast_load:
+            tmp = _tmp_path(cached)
+            try:
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                torch.save(model, tmp)
+                tmp.replace(cached)  # atomic: readers see the old file or the whole new one
+            except Exception as e:
+                print(f"Could not cache model: {e}")
+            finally:
+                tmp.unlink(missing_ok=True)
+        return model
+
+    def warmup(self):
+        """Run dummy forwards so CUDA context, kernels and lazy init are paid before the first job."""
+        self._transcribe_batch([torch.zeros(settings.sample_rate)])
+        with torch.inference_mode():
+            self.vad_model(torch.zeros(512), settings.sample_rate)
+        self.vad_model.reset_states()
 
     @property
     def is_ready(self) -> bool:
         return self.asr_model is not None and self.vad_model is not None
 
     def _merge_segments(self, timestamps: list[dict], sr: int) -> list[tuple[int, int]]:
-        if not timestamps:
-            return []
-
-        chunks = []
-        chunk_start = timestamps[0]['start']
-        chunk_end = timestamps[0]['end']
+        return merge_chunks([(ts['start'], ts['end']) for ts in timestamps], sr)
 
-        max_chunk = int(settings.max_chunk_duration * sr)
-        max_gap = int(settings.max_gap_duration * sr)
+    def _transcribe_tensor(self, audio: torch.Tensor) -> str:
+        """Transcribe tensor directly without saving to file."""
+        return self._transcribe_batch([audio.flatten()])[0]
 
-        for ts in timestamps[1:]:
-            gap = ts['start'] - chunk_end
-            new_duration = ts['end'] - chunk_start
+    def _encode(self, audios: list[torch.Tensor]) -> tuple[torch.Tensor, torch.Tensor]:
+        device = self.asr_model._device
+        length = torch.tensor([a.shape[-1] for a in audios], device=device)
+        wav = torch.nn.utils.rnn.pad_sequence(audios, batch_first=True)
+        wav = wav.to(device).to(self.asr_model._dtype)
+        return self.backend.encode(wav, length)
 
-            if new_duration > max_chunk or gap > max_gap:
-                chunks.append((chunk_start, chunk_end))
-                chunk_start = ts['start']
-            chunk_end = ts['end']
+    @torch.inference_mode()
+    def _transcribe_batch(self, audios: list[torch.Tensor]) -> list[str]:
+        """Transcribe several 1-D tensors in one padded forward pass."""
+        encoded, encoded_len = self._encode(audios)
+        return self.asr_model.decoding.decode(self.asr_model.head, encoded, encoded_len)
 
-        chunks.append((chunk_start, chunk_end))
-        return chunks
+    @torch.inference_mode()
+    def _transcribe_batch_words(self, audios: list[torch.Tensor]) -> list[tuple[str, list[dict]]]:
+        """Like _transcribe_batch, also returning words timed from the start of each tensor."""
+        encoded, encoded_len = self._encode(audios)
+        decoding = self.asr_model.decoding
+        results = []
+        decoded = greedy_decode(decoding, self.asr_model.head, encoded, encoded_len)
+        for audio, frames_total, (tokens, frames) in zip(audios, encoded_len.tolist(), decoded):
+            frame_duration = audio.shape[-1] / max(frames_total, 1) / settings.sample_rate
+            results.append((decoding.tokenizer.decode(tokens), token_words(decoding.tokenizer, tokens, frames, frame_duration)))
+        return results
 
-    def _transcribe_tensor(self, audio: torch.Tensor) -> str:
-        """Transcribe tensor directly without saving to file."""
-        wav = audio.to(self.asr_model._device).to(self.asr_model._dtype)
-        if wav.dim() == 1:
-            wav = wav.unsqueeze(0)
-        length = torch.tensor([wav.shape[-1]], device=self.asr_model._device)
-        encoded, encoded_len = self.asr_model.forward(wav, length)
-        return self.asr_model.decoding.decode(self.asr_model.head, encoded, encoded_len)[0]
-
-    def transcribe(self, audio_path: str | Path, on_progress=None) -> TranscribeResult:
-        audio_path = Path(audio_path)
+    def _decode_chunks(self, chunks: list[tuple[int, int, torch.Tensor]]) -> list[tuple[str, list[dict] | None]]:
+        """Text of each (start, end, audio) chunk, with absolute word times if word_timestamps is on."""
+        audios = [audio for _, _, audio in chunks]
+        if not settings.word_timestamps:
+            return [(text, None) for text in self._transcribe_batch(audios)]
         sr = settings.sample_rate
+        return [
+            (text, [
+                {**w, "start": round(start / sr + w["start"], 3), "end": round(start / sr + w["end"], 3)}
+                for w in words
+            ])
+            for (start, _, _), (text, words) in zip(chunks, self._transcribe_batch_words(audios))
+        ]
+
+    def _make_batches(self, lengths: list[int]) -> list[list[int]]:
+        """Group chunk indices by length so each batch stays within the padding budget."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        batch = []
+        for i in order:
+            # Sorted descending, so the first item sets the padded length
+            padded = lengths[batch[0]] if batch else lengths[i]
+            if batch and (len(batch) >= settings.batch_size
+                          or padded * (len(batch) + 1) > settings.max_batch_samples):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _iter_chunks(self, reader: AudioReader, on_vad=None) -> Iterator[tuple[int, int, torch.Tensor]]:
+        """Yield (start, end, audio) speech chunks while the file is still being decoded.
+
+        `on_vad(samples, track)` receives the speech probability track once VAD has run.
+        """
+        short_samples = int(settings.short_audio_threshold * settings.sample_rate)
+        windows = iter(reader)
+        head = []
+        for window in windows:
+            head.append(window)
+            if reader.samples_read > short_samples:
+                break
+        else:
+            # Short audio — no segmentation
+            if reader.samples_read:
+                yield 0, reader.samples_read, torch.cat(head)
+            return
 
-        wav, orig_sr = torchaudio.load(str(audio_path))
-        wav = wav.squeeze(0)
-        if orig_sr != sr:
-            wav = torchaudio.functional.resample(wav, orig_sr, sr)
-
-        duration = wav.shape[0] / sr
-
-        # Short audio — no segmentation
-        if duration <= settings.short_audio_threshold:
-            if on_progress:
-                on_progress(50)
-            text = self._transcribe_tensor(wav)
-            if on_progress:
-                on_progress(100)
-            return TranscribeResult(
-                text=text,
-                segments=[Segment(start=0.0, end=duration, text=text)],
-                duration=duration
-            )
-
-        # VAD segmentation
-        timestamps = get_speech_timestamps(
-            wav,
-            self.vad_model,
-            sampling_rate=sr,
-            max_speech_duration_s=settings.max_chunk_duration,
-            min_silence_duration_ms=settings.min_silence_duration_ms
+        chunker = SpeechChunker(self.vad_model, settings.sample_rate)
+        for window in itertools.chain(head, windows):
+            yield from chunker.feed(window)
+        yield from chunker.flush()
+        if on_vad:
+            on_vad(reader.samples_read, chunker.track)
+
+    def _open(self, audio_path: str | Path) -> AudioReader:
+        return AudioReader(audio_path, settings.sample_rate, settings.stream_window_duration)
+
+    def _prepare(self, audio_path: str | Path, on_vad=None) -> tuple[float, list[tuple[int, int, torch.Tensor]]]:
+        """Decode a whole file and return its duration and speech chunks."""
+        reader = self._open(audio_path)
+        chunks = list(self._iter_chunks(reader, on_vad))
+        return reader.duration, chunks
+
+    def _build_result(
+        self, chunks: list[tuple[int, int]], texts: list[str], duration: float, words: list[list[dict] | None] | None = None
+    ) -> TranscribeResult:
+        sr = settings.sample_rate
+        segments = [
+            Segment(start=start / sr, end=end / sr, text=text)
+            for (start, end), text in zip(chunks, texts)
+        ]
+        return TranscribeResult(
+            text=" ".join(texts),
+            segments=segments,
+            duration=duration,
+            words=[Word(**w) for chunk in words for w in chunk or []] if settings.word_timestamps and words else None
         )
 
-        if not timestamps:
-            return TranscribeResult(text="", segments=[], duration=duration)
+    def _iter_batches(self, reader: AudioReader, on_vad=None) -> Iterator[list[tuple[int, int, torch.Tensor]]]:
+        """Decode and run VAD in a background thread, yielding whatever chunks have closed so far.
+
+        ASR on one batch overlaps with VAD over the rest of the file; the
+        queue is bounded so a slow model also bounds memory.
+        """
+        chunk_queue = queue.Queue(maxsize=settings.pipeline_queue_size)
+        stop = threading.Event()
+        finished = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for chunk in self._iter_chunks(reader, on_vad):
+                    if not put(chunk):
+                        return
+                put(finished)
+            except Exception as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, name="asr-vad", daemon=True)
+        producer.start()
+        try:
+            while True:
+                items = [chunk_queue.get()]
+                while len(items) < settings.batch_size:
+                    try:
+                        items.append(chunk_queue.get_nowait())
+                    except queue.Empty:
+                        break
 
-        chunks = self._merge_segments(timestamps, sr)
-        total_chunks = len(chunks)
+                chunks = [item for item in items if isinstance(item, tuple)]
+                if chunks:
+                    yield chunks
+                for item in items:
+                    if isinstance(item, Exception):
+                        raise item
+                if items[-1] is finished:
+                    return
+        finally:
+            stop.set()
+            producer.join()
 
-        segments = []
+    def transcribe(
+        self, audio_path: str | Path, on_progress=None, on_segments=None, checkpoint=None, on_vad=None,
+        duration: float | None = None
+    ) -> TranscribeResult:
+        """Transcribe a file; `on_segments(start_idx, segments)` receives each batch as it is decoded.
+
+        Chunks found in `checkpoint` (see cache.ChunkCheckpoint) are not re-run,
+        and newly decoded chunks are saved to it. `duration`, as probed on
+        upload, scales progress for containers without a frame count (WebM, Opus).
+        """
+        reader = self._open(audio_path)
+        expected = reader.expected_samples or (int(duration * settings.sample_rate) if duration else None)
+        chunks = []
         texts = []
+        words = []
 
-        for i, (start, end) in enumerate(chunks):
-            audio_chunk = wav[start:end]
-            text = self._transcribe_tensor(audio_chunk)
+        for pending in self._iter_batches(reader, on_vad):
+            decoded = [checkpoint.get(start, end) if checkpoint else None for start, end, _ in pending]
+            todo = [i for i, item in enumerate(decoded) if item is None]
+            lengths = [pending[i][2].shape[0] for i in todo]
+            for batch in self._make_batches(lengths):
+                batch = [todo[j] for j in batch]
+                for i, item in zip(batch, self._decode_chunks([pending[i] for i in batch])):
+                    decoded[i] = item
+            if checkpoint and todo:
+                checkpoint.put([(pending[i][0], pending[i][1], *decoded[i]) for i in todo])
+            batch_texts = [text for text, _ in decoded]
+            if on_segments:
+                sr = settings.sample_rate
+                on_segments(len(chunks), [
+                    Segment(start=start / sr, end=end / sr, text=text)
+                    for (start, end, _), text in zip(pending, batch_texts)
+                ])
+            chunks.extend((start, end) for start, end, _ in pending)
+            texts.extend(batch_texts)
+            words.extend(chunk_words for _, chunk_words in decoded)
 
-            segments.append(Segment(
-                start=start / sr,
-                end=end / sr,
-                text=text
-            ))
-            texts.append(text)
+            if on_progress and expected:
+                on_progress(min(99, chunks[-1][1] * 100 // expected))
 
-            if on_progress:
-                on_progress(int((i + 1) / total_chunks * 100))
+        if on_progress:
+            on_progress(100)
+        return self._build_result(chunks, texts, reader.duration, words)
 
+    def detect_speech(self, audio_path: str | Path, on_vad=None) -> TranscribeResult:
+        """VAD only: speech chunks as segments with empty text, without running ASR."""
+        reader = self._open(audio_path)
+        chunker = SpeechChunker(self.vad_model, settings.sample_rate)
+        chunks = []  # bounds only: holding the chunk audio would keep the whole file in memory
+        for window in reader:
+            chunks.extend((start, end) for start, end, _ in chunker.feed(window))
+        chunks.extend((start, end) for start, end, _ in chunker.flush())
+        if on_vad:
+            on_vad(reader.samples_read, chunker.track)
+
+        sr = settings.sample_rate
         return TranscribeResult(
-            text=" ".join(texts),
-            segments=segments,
-            duration=duration
+            text="",
+            segments=[Segment(start=start / sr, end=end / sr, text="") for start, end in chunks],
+            duration=reader.duration
         )
 
+    def transcribe_many(
+        self, audio_paths: list[str | Path], on_progress: list | None = None, on_vad: list | None = None
+    ) -> list[TranscribeResult | Exception]:
+        """Transcribe several files at once, sharing inference batches across them.
+
+        A failure in one file is returned in its slot instead of being raised.
+        """
+        on_progress = on_progress or [None] * len(audio_paths)
+        on_vad = on_vad or [None] * len(audio_paths)
+        results: list[TranscribeResult | Exception | None] = [None] * len(audio_paths)
+        prepared = {}
+
+        for job, path in enumerate(audio_paths):
+            try:
+                prepared[job] = self._prepare(path, on_vad[job])
+            except Exception as e:
+                results[job] = e
+
+        # Flatten every chunk of every file into one work list
+        items = [(job, k) for job, (_, chunks) in prepared.items() for k in range(len(chunks))]
+        texts = {job: [""] * len(chunks) for job, (_, chunks) in prepared.items()}
+        words = {job: [None] * len(chunks) for job, (_, chunks) in prepared.items()}
+        done = dict.fromkeys(prepared, 0)
+
+        def chunk(job, k):
+            return prepared[job][1][k]
+
+        lengths = [chunk(job, k)[2].shape[0] for job, k in items]
+        for batch in self._make_batches(lengths):
+            batch_items = [items[i] for i in batch]
+            pending = [(job, k) for job, k in batch_items if results[job] is None]
+            if not pending:
+                continue
+            try:
+                decoded = self._decode_chunks([chunk(job, k) for job, k in pending])
+            except Exception as e:
+                for job, _ in pending:
+                    results[job] = e
+                continue
+
+            for (job, k), (text, chunk_words) in zip(pending, decoded):
+                texts[job][k] = text
+                words[job][k] = chunk_words
+                done[job] += 1
+            for job in {job for job, _ in pending}:
+                if on_progress[job]:
+                    on_progress[job](int(done[job] / len(texts[job]) * 100))
+
+        for job, (duration, chunks) in prepared.items():
+            if results[job] is None:
+                ranges = [(start, end) for start, end, _ in chunks]
+                results[job] = self._build_result(ranges, texts[job], duration, words[job])
+        return results
+
 
 asr_service = ASRService()
@@ -0,0 +1,95 @@
+"""Live transcription over WebSocket, served by the worker next to its job loop."""
+import asyncio
+
+import torch
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from silero_vad import load_silero_vad
+
+from .config import settings
+from .chunking import SpeechChunker
+from .models import Segment
+from .service import asr_service
+
+
+app = FastAPI(title="ASR stream")
+
+
+class StreamSession:
+    """Incremental VAD over PCM as it arrives; chunks close by the same rules as file jobs.
+
+    Each session has its own VAD model, whose state carries over between frames.
+    """
+
+    def __init__(self, vad_model):
+        self.chunker = SpeechChunker(vad_model, settings.sample_rate, streaming=True)
+        self.remainder = b""
+        self.index = 0  # of the next final segment
+        self.partial_at = 0  # end sample of the last partial sent
+
+    def feed(self, pcm: bytes) -> list[tuple[int, int, torch.Tensor]]:
+        """Feed 16-bit little-endian mono PCM, returning chunks that closed."""
+        pcm = self.remainder + pcm
+        usable = len(pcm) - len(pcm) % 2
+        self.remainder = pcm[usable:]
+        if not usable:
+            return []
+        audio = torch.frombuffer(bytearray(pcm[:usable]), dtype=torch.int16).float() / 32768
+        return self.chunker.feed(audio)
+
+    def due_partial(self) -> tuple[int, int, torch.Tensor] | None:
+        """The open chunk, once it has grown by stream_partial_interval since the last partial."""
+        pending = self.chunker.pending()
+        if pending is None or pending[1] - self.partial_at < settings.stream_partial_interval * settings.sample_rate:
+            return None
+        self.partial_at = pending[1]
+        return pending
+
+    def flush(self) -> list[tuple[int, int, torch.Tensor]]:
+        return self.chunker.flush()
+
+
+def segment(start: int, end: int, text: str) -> dict:
+    sr = settings.sample_rate
+    return Segment(start=start / sr, end=end / sr, text=text).model_dump()
+
+
+@app.websocket("/v1/stream")
+async def stream(ws: WebSocket):
+    """Binary messages carry PCM (s16le, mono, sample_rate); the text message "end" flushes and closes.
+
+    Replies are JSON: {"type": "partial" | "final", "index": n, "segment": Segment}.
+    Partials revise the open utterance; a final replaces the partials of its index.
+    """
+    await ws.accept()
+    if not asr_service.is_ready:
+        await ws.close(code=1013, reason="Models are still loading")
+        return
+    session = StreamSession(await asyncio.to_thread(load_silero_vad))
+
+    async def send_final(chunks):
+        for start, end, audio in chunks:
+            text = await asyncio.to_thread(asr_service._transcribe_tensor, audio)
+            await ws.send_json({"type": "final", "index": session.index, "segment": segment(start, end, text)})
+            session.index += 1
+            session.partial_at = end
+
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") == "end":
+                await send_final(await asyncio.to_thread(session.flush))
+                await ws.close()
+                return
+            if not message.get("bytes"):
+                continue
+
+            await send_final(await asyncio.to_thread(session.feed, message["bytes"]))
+            pending = session.due_partial()
+            if pending:
+                start, end, audio = pending
+                text = await asyncio.to_thread(asr_service._transcribe_tensor, audio)
+                await ws.send_json({"type": "partial", "index": session.index, "segment": segment(start, end, text)})
+    except WebSocketDisconnect:
+        pass
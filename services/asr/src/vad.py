@@ -0,0 +1,118 @@
+"""Speech detection over Silero probability tracks.
+
+Torch-free, so the API can re-segment a stored track without loading the model.
+"""
+from .config import settings
+
+
+FRAME = 512  # Silero window at 16 kHz, one probability per frame
+
+
+class ChunkMerger:
+    """Merge VAD timestamps into chunks bounded by max_chunk_duration and max_gap_duration.
+
+    Timestamps are pushed in order and a chunk is returned as soon as it
+    can no longer grow, so it works both over a full list and over a stream.
+    """
+
+    def __init__(self, sr: int):
+        self.max_chunk = int(settings.max_chunk_duration * sr)
+        self.max_gap = int(settings.max_gap_duration * sr)
+        self.start: int | None = None
+        self.end: int | None = None
+
+    def push(self, start: int, end: int) -> tuple[int, int] | None:
+        closed = None
+        if self.start is not None and (end - self.start > self.max_chunk or start - self.end > self.max_gap):
+            closed = self.flush()
+        if self.start is None:
+            self.start = start
+        self.end = end
+        return closed
+
+    def close_before(self, position: int) -> tuple[int, int] | None:
+        """Close the open chunk if no timestamp starting at or after `position` could join it."""
+        if self.start is not None and (position - self.end > self.max_gap or position - self.start > self.max_chunk):
+            return self.flush()
+        return None
+
+    def flush(self) -> tuple[int, int] | None:
+        if self.start is None:
+            return None
+        closed = (self.start, self.end)
+        self.start = self.end = None
+        return closed
+
+
+class SpeechDetector:
+    """Turn per-frame speech probabilities into (start, end) sample ranges.
+
+    Same rules as silero's VADIterator, plus what get_speech_timestamps adds:
+    the hard split at max_chunk_duration (max_speech_duration_s) and dropping
+    ranges no longer than min_speech_duration_ms.
+    """
+
+    def __init__(self, sr: int, threshold: float | None = None, min_silence_ms: int | None = None, speech_pad_ms: int = 30):
+        self.threshold = settings.vad_threshold if threshold is None else threshold
+        min_silence_ms = settings.min_silence_duration_ms if min_silence_ms is None else min_silence_ms
+        self.min_silence = sr * min_silence_ms // 1000
+        self.speech_pad = sr * speech_pad_ms // 1000
+        self.min_speech = sr * settings.min_speech_duration_ms // 1000
+        self.max_speech = int(settings.max_chunk_duration * sr)
+
+        self.position = 0  # samples covered by the probabilities pushed so far
+        self.speech_start: int | None = None
+        self.temp_end = 0
+
+    def push(self, prob: float) -> tuple[int, int] | None:
+        self.position += FRAME
+        if prob >= self.threshold:
+            self.temp_end = 0
+            if self.speech_start is None:
+                self.speech_start = max(0, self.position - self.speech_pad - FRAME)
+                return None
+        elif prob < self.threshold - 0.15 and self.speech_start is not None:
+            self.temp_end = self.temp_end or self.position
+            if self.position - self.temp_end >= self.min_silence:
+                start, end = self.speech_start, self.temp_end + self.speech_pad - FRAME
+                self.speech_start, self.temp_end = None, 0
+                return (start, end) if end - start > self.min_speech else None
+
+        if self.speech_start is not None and self.position - self.speech_start >= self.max_speech:
+            start, self.speech_start = self.speech_start, self.position
+            return start, self.position
+        return None
+
+    def flush(self, total: int) -> tuple[int, int] | None:
+        """Close speech still open at the end of `total` samples."""
+        start, self.speech_start = self.speech_start, None
+        if start is not None and total - start > self.min_speech:
+            return start, total
+        return None
+
+
+def unpack(track: bytes) -> list[float]:
+    """Probabilities from a track stored as one byte per frame."""
+    return [b / 255 for b in track]
+
+
+def speech_timestamps(
+    probs: list[float],
+    total: int,
+    sr: int,
+    threshold: float | None = None,
+    min_silence_ms: int | None = None
+) -> list[tuple[int, int]]:
+    """Re-run thresholding over a stored probability track covering `total` samples."""
+    detector = SpeechDetector(sr, threshold, min_silence_ms)
+    timestamps = [detector.push(p) for p in probs]
+    timestamps.append(detector.flush(total))
+    return [(start, min(end, total)) for start, end in filter(None, timestamps) if start < total]
+
+
+def merge_chunks(timestamps: list[tuple[int, int]], sr: int) -> list[tuple[int, int]]:
+    """Group speech timestamps into the chunks ASR would transcribe."""
+    merger = ChunkMerger(sr)
+    chunks = [merger.push(start, end) for start, end in timestamps]
+    chunks.append(merger.flush())
+    return [chunk for chunk in chunks if chunk]
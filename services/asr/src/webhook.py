@@ -0,0 +1,9 @@
+from .clients import get_http
+from .models import JobState
+
+
+async def send_webhook(callback_url: str, state: JobState):
+    try:
+        await get_http().post(callback_url, json=state.model_dump())
+    except Exception as e:
+        print(f"Webhook failed: {e}")
@@ -0,0 +1,52 @@
+"""Word timestamps from the RNNT greedy decode that already produces the text."""
+import torch
+
+
+def greedy_decode(decoding, head, encoded: torch.Tensor, encoded_len: torch.Tensor) -> list[tuple[list[int], list[int]]]:
+    """GigaAM's RNNT greedy decoding, also keeping the encoder frame of every emitted token."""
+    results = []
+    encoded = encoded.transpose(1, 2)
+    for i in range(encoded.shape[0]):
+        x = encoded[i].unsqueeze(1)
+        tokens, frames = [], []
+        state, label = None, None
+        for t in range(int(encoded_len[i])):
+            f = x[t].unsqueeze(1)
+            for _ in range(decoding.max_symbols):
+                g, hidden = head.decoder.predict(label, state)
+                k = head.joint.joint(f, g)[0, 0, 0, :].argmax(0).item()
+                if k == decoding.blank_id:
+                    break
+                tokens.append(k)
+                frames.append(t)
+                state = hidden
+                label = torch.tensor([[k]], device=x.device)
+        results.append((tokens, frames))
+    return results
+
+
+def _piece(tokenizer, token: int) -> str:
+    if tokenizer.charwise:
+        return tokenizer.vocab[token]
+    return tokenizer.model.id_to_piece(token).replace("▁", " ")
+
+
+def token_words(tokenizer, tokens: list[int], frames: list[int], frame_duration: float) -> list[dict]:
+    """Group tokens into words; a word spans from its first token's frame to the end of its last."""
+    words = []
+    text, first, last = "", None, None
+    for token, frame in zip(tokens, frames):
+        piece = _piece(tokenizer, token)
+        if piece.startswith(" ") and text:
+            words.append({"start": first * frame_duration, "end": (last + 1) * frame_duration, "word": text})
+            text = ""
+        piece = piece.strip()
+        if not piece:
+            continue
+        if not text:
+            first = frame
+        text += piece
+        last = frame
+    if text:
+        words.append({"start": first * frame_duration, "end": (last + 1) * frame_duration, "word": text})
+    return words
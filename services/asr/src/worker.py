@@ -1,81 +1,394 @@
 import json
+import time
+import uuid
+import signal
 import asyncio
-import httpx
-from redis import asyncio as aioredis
+import multiprocessing
+import torch
 from pathlib import Path
 
 from .config import settings
 from .service import asr_service
-from .models import JobStatus, JobState
+from .models import JobStatus, Segment, TranscribeResult
 from . import database as db
+from . import events
+from . import cache
+from . import jobqueue
+from .webhook import send_webhook
+from .clients import get_redis
 
 
-async def get_redis():
-    return await aioredis.from_url(settings.redis_url)
+async def update_job(job_id: str, status: JobStatus, **kwargs):
+    """Write job state to SQLite and announce the change to SSE listeners."""
+    await db.update_job(job_id, status, **kwargs)
+    await events.publish({"type": "job", "job_id": job_id, "status": status.value, "progress": kwargs.get("progress")})
 
 
-async def send_webhook(callback_url: str, state: JobState):
-    try:
-        async with httpx.AsyncClient(timeout=settings.webhook_timeout) as client:
-            await client.post(callback_url, json=state.model_dump())
-    except Exception as e:
-        print(f"Webhook failed: {e}")
+async def report_progress(job_id: str, pct: int):
+    await db.queue_progress(job_id, pct)
+    await events.publish({"type": "job", "job_id": job_id, "status": JobStatus.processing.value, "progress": pct})
 
 
-async def process_job(job_data: dict):
-    job_id = job_data["job_id"]
-    audio_path = job_data["audio_path"]
-    callback_url = job_data.get("callback_url")
+async def add_segments(job_id: str, start_idx: int, segments: list[dict]):
+    await db.append_segments(job_id, start_idx, segments)
+    await events.publish({"type": "segments", "job_id": job_id, "after": start_idx, "segments": segments})
 
-    await db.update_job(job_id, JobStatus.processing, progress=0)
 
-    loop = asyncio.get_event_loop()
+def make_progress_callback(job_id: str, loop: asyncio.AbstractEventLoop):
     last_progress = [0]  # mutable container for closure
 
     def on_progress(pct: int):
         if pct > last_progress[0]:
             last_progress[0] = pct
             asyncio.run_coroutine_threadsafe(
-                db.update_job(job_id, JobStatus.processing, progress=pct),
+                report_progress(job_id, pct),
                 loop
             )
 
-    try:
-        result = await asyncio.to_thread(asr_service.transcribe, audio_path, on_progress)
-        await db.update_job(job_id, JobStatus.done, result=result.model_dump(), progress=100)
-        state = await db.get_job(job_id)
-    except Exception as e:
-        await db.update_job(job_id, JobStatus.error, error=str(e))
-        state = await db.get_job(job_id)
-    finally:
-        Path(audio_path).unlink(missing_ok=True)
+    return on_progress
+
+
+def make_segments_callback(job_id: str, loop: asyncio.AbstractEventLoop):
+    def on_segments(start_idx: int, segments: list[Segment]):
+        asyncio.run_coroutine_threadsafe(
+            add_segments(job_id, start_idx, [s.model_dump() for s in segments]),
+            loop
+        )
+
+    return on_segments
+
+
+def make_vad_callback(job_id: str, loop: asyncio.AbstractEventLoop):
+    def on_vad(samples: int, track: bytes):
+        asyncio.run_coroutine_threadsafe(
+            db.save_vad_track(job_id, settings.sample_rate, samples, track),
+            loop
+        )
+
+    return on_vad
+
+
+async def finish_job(job_data: dict, result: TranscribeResult | Exception):
+    job_id = job_data["job_id"]
+    callback_url = job_data.get("callback_url")
+
+    if isinstance(result, Exception):
+        await update_job(job_id, JobStatus.error, error=str(result))
+    else:
+        await db.complete_job(job_id, result.model_dump())
+        if job_data.get("audio_hash"):
+            try:
+                redis = get_redis()
+                await cache.put_result(redis, job_data["audio_hash"], result.model_dump())
+                # The full result supersedes the per-chunk checkpoints
+                await cache.drop_chunks(redis, job_data["audio_hash"])
+            except Exception as e:
+                print(f"Cache store failed: {e}")
+        await events.publish({"type": "job", "job_id": job_id, "status": JobStatus.done.value, "progress": 100})
+    state = await db.get_job(job_id)
+    Path(job_data["audio_path"]).unlink(missing_ok=True)
 
     if callback_url and state:
         await send_webhook(callback_url, state)
 
 
-async def worker_loop():
-    print("Initializing database...")
-    await db.init_db()
+async def process_job(job_data: dict):
+    job_id = job_data["job_id"]
+    await update_job(job_id, JobStatus.processing, progress=0)
 
-    print("Loading models...")
-    asr_service.load_models()
-    print("Models loaded. Worker ready.")
+    loop = asyncio.get_event_loop()
+    on_vad = make_vad_callback(job_id, loop)
+    if job_data.get("stage") == "vad":
+        try:
+            result = await asyncio.to_thread(asr_service.detect_speech, job_data["audio_path"], on_vad)
+        except Exception as e:
+            result = e
+        await finish_job(job_data, result)
+        return
 
-    redis = await get_redis()
+    on_progress = make_progress_callback(job_id, loop)
+    on_segments = make_segments_callback(job_id, loop)
+    checkpoint = None
+    if job_data.get("audio_hash"):
+        checkpoint = await cache.ChunkCheckpoint.load(get_redis(), job_data["audio_hash"])
+        if checkpoint.done:
+            print(f"Resuming job {job_id}: {len(checkpoint.done)} chunks already transcribed")
+    try:
+        result = await asyncio.to_thread(
+            asr_service.transcribe, job_data["audio_path"], on_progress, on_segments, checkpoint, on_vad,
+            duration=job_data.get("duration")
+        )
+    except Exception as e:
+        result = e
+    await finish_job(job_data, result)
 
+
+def batchable(job_data: dict) -> bool:
+    """Short transcriptions, one chunk each, which gain the most from sharing batches.
+
+    Longer files fill batches on their own and need the streamed segments and
+    chunk checkpoints that only process_job provides.
+    """
+    duration = job_data.get("duration")
+    return job_data.get("stage") != "vad" and duration is not None and duration <= settings.short_audio_threshold
+
+
+async def process_batch(jobs: list[dict]):
+    """Transcribe several short jobs together so they share inference batches (see batchable)."""
+    loop = asyncio.get_event_loop()
+    for job_data in jobs:
+        await update_job(job_data["job_id"], JobStatus.processing, progress=0)
+
+    callbacks = [make_progress_callback(job_data["job_id"], loop) for job_data in jobs]
+    vad_callbacks = [make_vad_callback(job_data["job_id"], loop) for job_data in jobs]
+    paths = [job_data["audio_path"] for job_data in jobs]
+    try:
+        results = await asyncio.to_thread(asr_service.transcribe_many, paths, callbacks, vad_callbacks)
+    except Exception as e:
+        results = [e] * len(jobs)
+
+    await asyncio.gather(*(finish_job(job_data, result) for job_data, result in zip(jobs, results)))
+
+
+async def collect_jobs(redis, lanes: jobqueue.LaneScheduler, processing_key: str) -> list[bytes]:
+    """Block for one job, then keep draining the queue until it is full or the deadline passes.
+
+    Draining stops at the first job that can't be batched: it is run alone,
+    and the rest stay queued for other replicas instead of waiting behind it.
+    """
+    job_json = await lanes.fetch(redis, processing_key, timeout=30)
+    if job_json is None:
+        return []
+    jobs = [job_json]
+    if not batchable(json.loads(job_json)):
+        return jobs
+
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + settings.scheduler_max_wait_ms / 1000
+    while len(jobs) < settings.scheduler_max_jobs:
+        job_json = await lanes.fetch(redis, processing_key)
+        if job_json is not None:
+            jobs.append(job_json)
+            if not batchable(json.loads(job_json)):
+                break
+            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(0.005, remaining))
+    return jobs
+
+
+async def heartbeat_loop(redis, worker_id: str, status: dict):
+    """Keep this worker's in-flight jobs claimed; they are requeued once the key expires.
+
+    The value doubles as the readiness signal reported by GET /v1/workers.
+    """
+    key = f"{settings.redis_heartbeat_prefix}{worker_id}"
+    status = json.dumps(status)
     while True:
-        result = await redis.brpop(settings.redis_queue_key, timeout=30)
-        if result is None:
+        try:
+            await redis.set(key, status, ex=settings.visibility_timeout)
+        except Exception as e:
+            print(f"Heartbeat failed: {e}")
+        await asyncio.sleep(settings.visibility_timeout / 3)
+
+
+async def reap_job(redis, job_json: bytes, claim_key: str):
+    """Requeue or dead-letter one claimed job. Its state is written first,
+    so a worker picking the requeued job up right away isn't overwritten."""
+    job_data = json.loads(job_json)
+    job_id = job_data["job_id"]
+    state = await db.get_job(job_id)
+    if state is None or state.status in (JobStatus.done, JobStatus.error):
+        # Finished (or deleted) before the worker could ack it
+        await redis.lrem(claim_key, 1, job_json)
+        return
+
+    job_data["attempts"] = job_data.get("attempts", 0) + 1
+    if job_data["attempts"] >= settings.max_attempts:
+        print(f"Job {job_id} abandoned {job_data['attempts']} times, moving to dead-letter list")
+        await update_job(job_id, JobStatus.error, error=f"Worker lost {job_data['attempts']} times")
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(settings.redis_dead_key, json.dumps(job_data))
+            pipe.lrem(claim_key, 1, job_json)
+            await pipe.execute()
+    else:
+        print(f"Requeueing abandoned job {job_id} (attempt {job_data['attempts'] + 1})")
+        await update_job(job_id, JobStatus.pending, progress=0)
+        await jobqueue.requeue(redis, job_data, claim_key, job_json)
+
+
+async def requeue_abandoned(redis, claim_key: str):
+    """Move jobs of workers whose heartbeat expired back to the queue, or to the dead-letter list.
+
+    Each job is first moved into `claim_key`, this worker's own processing
+    list, and leaves it in the same transaction that requeues it. A job is
+    never lost or requeued twice, and if this worker dies mid-way the next
+    reaper finds the job there. A job that fails to reap goes back to the
+    dead worker's list for the next pass.
+    """
+    async for key in redis.scan_iter(match=f"{settings.redis_processing_prefix}*"):
+        worker_id = key.decode()[len(settings.redis_processing_prefix):]
+        if await redis.exists(f"{settings.redis_heartbeat_prefix}{worker_id}"):
             continue
-        _, job_json = result
-        job_data = json.loads(job_json)
-        print(f"Processing job: {job_data['job_id']}")
-        await process_job(job_data)
+
+        while (job_json := await redis.lmove(key, claim_key, "RIGHT", "LEFT")) is not None:
+            try:
+                await reap_job(redis, job_json, claim_key)
+            except Exception as e:
+                print(f"Reaping failed, returning job to {key.decode()}: {e}")
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.lrem(claim_key, 1, job_json)
+                    pipe.rpush(key, job_json)
+                    await pipe.execute()
+                break
+
+
+async def reaper_loop(redis, claim_key: str):
+    while True:
+        try:
+            await requeue_abandoned(redis, claim_key)
+        except Exception as e:
+            print(f"Reaper failed: {e}")
+        await asyncio.sleep(settings.reaper_interval)
+
+
+async def serve_stream():
+    import uvicorn
+    from .stream import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=settings.stream_port, log_level="warning"))
+    await server.serve()
+
+
+async def worker_loop(stream: bool = True):
+    print("Initializing database...")
+    await db.init_db()
+
+    redis = get_redis()
+    worker_id = uuid.uuid4().hex[:12]
+    heartbeat_key = f"{settings.redis_heartbeat_prefix}{worker_id}"
+
+    # docker stop and the pool send SIGTERM; cancel so the cleanup below runs
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    # Announce the worker while models load so the gateway can tell "starting" from "ready"
+    await redis.set(heartbeat_key, json.dumps({"state": "loading", "since": time.time()}), ex=settings.model_load_timeout)
+
+    background = []
+    try:
+        print("Loading models...")
+        cold_start = await asyncio.to_thread(asr_service.load_models)
+        print(f"Models loaded in {cold_start:.1f}s. Worker ready.")
+        await cache.publish_fingerprint(redis)
+
+        # Jobs are moved, not popped, into a per-worker list and removed only when finished
+        processing_key = f"{settings.redis_processing_prefix}{worker_id}"
+        background.append(asyncio.create_task(heartbeat_loop(redis, worker_id, {
+            "state": "ready", "since": time.time(), "cold_start_s": round(cold_start, 2)
+        })))
+        background.append(asyncio.create_task(reaper_loop(redis, processing_key)))
+        if stream and settings.stream_port:
+            print(f"Serving live transcription on port {settings.stream_port}")
+            background.append(asyncio.create_task(serve_stream()))
+
+        lanes = jobqueue.LaneScheduler()
+
+        if settings.scheduler_enabled:
+            while True:
+                raw_jobs = await collect_jobs(redis, lanes, processing_key)
+                if not raw_jobs:
+                    continue
+                jobs = [json.loads(job_json) for job_json in raw_jobs]
+                # Short clips first, so they are not held up behind long recordings
+                batch = [j for j in jobs if batchable(j)]
+                if batch:
+                    print(f"Processing batch of {len(batch)} jobs: {', '.join(j['job_id'] for j in batch)}")
+                    await process_batch(batch)
+                for job_data in [j for j in jobs if not batchable(j)]:
+                    print(f"Processing job: {job_data['job_id']}")
+                    await process_job(job_data)
+                for job_json in raw_jobs:
+                    await redis.lrem(processing_key, 1, job_json)
+
+        while True:
+            job_json = await lanes.fetch(redis, processing_key, timeout=30)
+            if job_json is None:
+                continue
+            job_data = json.loads(job_json)
+            print(f"Processing job: {job_data['job_id']}")
+            await process_job(job_data)
+            await redis.lrem(processing_key, 1, job_json)
+    except asyncio.CancelledError:
+        print("Shutting down...")
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        # Drop the heartbeat now rather than when it expires: the gateway stops
+        # counting this worker as ready, and the reaper requeues its jobs right away
+        try:
+            await redis.delete(heartbeat_key)
+        except Exception as e:
+            print(f"Heartbeat cleanup failed: {e}")
+        # Progress ticks are buffered; write them before the connection goes
+        try:
+            await db.flush_progress()
+        except Exception as e:
+            print(f"Progress flush failed: {e}")
+        await db.close_db()
+
+
+def run_replica(index: int):
+    if settings.pool_threads:
+        torch.set_num_threads(settings.pool_threads)
+    print(f"Replica {index} starting with {torch.get_num_threads()} torch threads")
+    asyncio.run(worker_loop(stream=index == 0))
+
+
+def run_pool():
+    """Run pool_size replicas as separate processes, restarting any that die."""
+    ctx = multiprocessing.get_context("spawn")  # fork is unsafe with CUDA
+    procs = {}
+
+    def spawn(index: int):
+        proc = ctx.Process(target=run_replica, args=(index,), name=f"asr-replica-{index}")
+        proc.start()
+        procs[index] = proc
+
+    def shutdown(signum, frame):
+        raise SystemExit(0)
+
+    # As PID 1 the supervisor would otherwise ignore docker stop's SIGTERM and be killed
+    # without passing it on, so no replica would run its shutdown path
+    signal.signal(signal.SIGTERM, shutdown)
+    for index in range(settings.pool_size):
+        spawn(index)
+
+    try:
+        while True:
+            time.sleep(5)
+            for index, proc in list(procs.items()):
+                if not proc.is_alive():
+                    print(f"Replica {index} exited with code {proc.exitcode}, restarting")
+                    spawn(index)
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # a second one must not cut the joins short
+        print("Stopping replicas...")
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.join()
 
 
 def run_worker():
-    asyncio.run(worker_loop())
+    if settings.pool_size > 1:
+        run_pool()
+    else:
+        if settings.pool_threads:
+            torch.set_num_threads(settings.pool_threads)
+        asyncio.run(worker_loop())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the service as `src`, like `python -m src.worker` does from services/asr
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,122 @@
+import os
+import copy
+import wave
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("gigaam")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("silero_vad")
+pytest.importorskip("pydantic_settings")
+
+from silero_vad import load_silero_vad
+
+from src.config import settings
+from src.service import BACKENDS, ASRService, OnnxBackend, TorchBackend
+
+
+SPEECH = Path(os.getenv("ASR_TEST_AUDIO", Path(__file__).parent / "fixtures" / "speech.wav"))
+# Max word error rate against the full-precision torch transcript
+WER_TOLERANCE = {"onnx": 0.02, "torch_int8": 0.10, "onnx_int8": 0.10}
+
+
+def wer(reference: str, hypothesis: str) -> float:
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return float(bool(hyp))
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    settings.model_cache_dir = tmp_path_factory.mktemp("models")
+    service = ASRService()
+    service.device = "cpu"
+    return service._load_asr_model()
+
+
+def service_with(model, backend: str) -> ASRService:
+    service = ASRService()
+    service.device = "cpu"
+    service.asr_model = copy.deepcopy(model)  # quantization rewrites the encoder in place
+    service.backend = BACKENDS[backend](service.asr_model)
+    service.vad_model = load_silero_vad()
+    return service
+
+
+def test_wer():
+    assert wer("a b c d", "a b c d") == 0
+    assert wer("a b c d", "a x c") == 0.5
+
+
+def test_onnx_encoder_handles_long_inputs(model):
+    """The export traces a 1 s dummy; longer, mixed-length batches must still match torch."""
+    torch.manual_seed(0)
+    lengths = [settings.sample_rate * s for s in (23, 7, 1)]
+    wav = torch.nn.utils.rnn.pad_sequence([torch.randn(n) * 0.1 for n in lengths], batch_first=True)
+    length = torch.tensor(lengths)
+
+    with torch.inference_mode():
+        expected, expected_len = TorchBackend(model).encode(wav, length)
+        encoded, encoded_len = OnnxBackend(copy.deepcopy(model)).encode(wav, length)
+
+    assert encoded.shape == expected.shape
+    assert encoded_len.tolist() == expected_len.tolist()
+    for i, frames in enumerate(expected_len.tolist()):
+        diff = (encoded[i, :, :frames] - expected[i, :, :frames]).abs().max()
+        assert diff <= 1e-3 * expected[i, :, :frames].abs().max()
+
+
+def write_voiced(path: Path, seconds: float = 12.0):
+    """Vowel-like syllables (harmonics of a varying pitch under random formants) in words split by pauses.
+
+    Stands in for a recording when none is present. It is not language, so it
+    shows the backends agree with each other, not that they transcribe well.
+    """
+    sr = settings.sample_rate
+    gen = torch.Generator().manual_seed(0)
+    t = torch.arange(int(0.2 * sr)) / sr
+    envelope = torch.sin(torch.pi * t / t[-1])
+    pieces = []
+    while sum(piece.numel() for piece in pieces) < seconds * sr:
+        for _ in range(int(torch.randint(2, 5, (1,), generator=gen))):
+            f0 = 100 + 60 * torch.rand(1, generator=gen)
+            formants = torch.tensor([300.0, 900.0]) + torch.tensor([500.0, 1400.0]) * torch.rand(2, generator=gen)
+            freqs = f0 * torch.arange(1, 40)
+            gains = torch.exp(-((freqs[:, None] - formants) / 120) ** 2).sum(1)
+            pieces.append(envelope * (gains[:, None] * torch.sin(2 * torch.pi * freqs[:, None] * t)).sum(0))
+        pieces.append(torch.zeros(int(0.3 * sr)))
+    audio = torch.cat(pieces)
+    pcm = (audio / audio.abs().max() * 0.5 * 32767).to(torch.int16)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(pcm.numpy().tobytes())
+
+
+@pytest.fixture(scope="module")
+def speech(tmp_path_factory) -> Path:
+    if SPEECH.exists():
+        return SPEECH
+    path = tmp_path_factory.mktemp("audio") / "voiced.wav"
+    write_voiced(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def reference(model, speech):
+    return service_with(model, "torch").transcribe(speech).text
+
+
+@pytest.mark.parametrize("backend", sorted(WER_TOLERANCE))
+def test_backend_wer_parity(model, speech, reference, backend):
+    hypothesis = service_with(model, backend).transcribe(speech).text
+    assert wer(reference, hypothesis) <= WER_TOLERANCE[backend]
@@ -0,0 +1,74 @@
+import time
+from collections import deque
+
+
+DAY = 24 * 3600
+
+
+class AdaptiveIdlePolicy:
+    """Decide when to stop or pre-start an on-demand service from its recent request arrivals.
+
+    Idle timeout: long enough to cover most gaps between requests seen in the
+    last `window` seconds, so bursts never hit a cold start, but capped so a
+    sparse pattern doesn't keep the GPU busy for nothing.
+
+    Pre-start: if previous days had traffic in the next `lookahead` seconds
+    at this time of day, start the service before the first request arrives.
+    Once per look-ahead window: if nobody comes, the idle timeout stops it and
+    it stays stopped until a real arrival or the window has passed.
+    """
+
+    def __init__(
+        self,
+        base_timeout: float,
+        min_timeout: float,
+        max_timeout: float,
+        window: float = 3600,
+        lookahead: float = 600,
+        min_expected: float = 1.0,
+        history_days: int = 7
+    ):
+        self.base_timeout = base_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.window = window
+        self.lookahead = lookahead
+        self.min_expected = min_expected
+        self.history_days = history_days
+        self.arrivals: deque[float] = deque()
+        self.prestarted_at: float | None = None
+
+    def record(self, now: float | None = None):
+        now = now or time.time()
+        self.arrivals.append(now)
+        while self.arrivals and self.arrivals[0] < now - self.history_days * DAY:
+            self.arrivals.popleft()
+
+    def idle_timeout(self, now: float | None = None) -> float:
+        now = now or time.time()
+        recent = [t for t in self.arrivals if t >= now - self.window]
+        if len(recent) < 3:
+            return self.base_timeout
+        gaps = sorted(b - a for a, b in zip(recent, recent[1:]))
+        p90 = gaps[min(len(gaps) - 1, int(len(gaps) * 0.9))]
+        if p90 > self.max_timeout:
+            # Requests are too far apart to bridge: stop early and accept the cold start
+            return self.min_timeout
+        return max(self.min_timeout, p90)
+
+    def prestarted(self, now: float | None = None):
+        self.prestarted_at = now or time.time()
+
+    def should_prestart(self, now: float | None = None) -> bool:
+        now = now or time.time()
+        if self.prestarted_at is not None and now - self.prestarted_at < self.lookahead:
+            if not self.arrivals or self.arrivals[-1] < self.prestarted_at:
+                return False  # already pre-started for this window and nobody came
+        if not self.arrivals or now - self.arrivals[0] < DAY:
+            return False  # less than a day of history
+        days = min(self.history_days, int((now - self.arrivals[0]) // DAY))
+        expected = 0
+        for day in range(1, days + 1):
+            start = now - day * DAY
+            expected += sum(1 for t in self.arrivals if start <= t < start + self.lookahead)
+        return expected / days >= self.min_expected
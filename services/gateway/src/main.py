@@ -1,28 +1,50 @@
 import os
 import asyncio
-import subprocess
 import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
 import httpx
+import websockets
 from pathlib import Path
 
+from .orchestrator import DockerClient, ServiceController, ServiceState
+from .idle_policy import AdaptiveIdlePolicy
+from .summarizer import ChunkSummarizer, split_sentences
+
 # === Config ===
 ASR_URL = os.getenv("ASR_URL", "http://asr-api:8001")
+ASR_STREAM_URL = os.getenv("ASR_STREAM_URL", "ws://asr-worker:8002")
 LLM_URL = os.getenv("LLM_URL", "http://llm:8080")
 IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", "120"))
+IDLE_TIMEOUT_MIN = int(os.getenv("IDLE_TIMEOUT_MIN", "60"))
+IDLE_TIMEOUT_MAX = int(os.getenv("IDLE_TIMEOUT_MAX", "900"))
+ADAPTIVE_IDLE = os.getenv("ADAPTIVE_IDLE", "true").lower() == "true"
+PRESTART_LOOKAHEAD = int(os.getenv("PRESTART_LOOKAHEAD", "600"))  # seconds
+ASR_WORKER_READY_TIMEOUT = int(os.getenv("ASR_WORKER_READY_TIMEOUT", "600"))
 COMPOSE_PROJECT = os.getenv("COMPOSE_PROJECT_NAME", "transcribe")
+DOCKER_HOST = os.getenv("DOCKER_HOST", "unix:///var/run/docker.sock")
 
 # LLM parameters
 LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "180"))
 LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "4000"))
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.3"))
 
+# Long transcripts: map-reduce in chunks sized for one llama.cpp slot (--ctx-size / --parallel)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_CHARS_PER_TOKEN = float(os.getenv("SUMMARY_CHARS_PER_TOKEN", "3.0"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "2"))
+SUMMARY_MAP_MAX_TOKENS = int(os.getenv("SUMMARY_MAP_MAX_TOKENS", "1000"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2000"))  # cached chunk summaries
+
 # ASR parameters
 ASR_TIMEOUT = int(os.getenv("ASR_TIMEOUT", "300"))  # upload timeout for large files
 
+# Shared HTTP client pool
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
 # Prompts
 SUMMARY_PROMPT = os.getenv("SUMMARY_PROMPT", """Проанализируй транскрипт встречи и выдели:
 1. Краткое содержание (2-3 предложения)
@@ -33,66 +55,83 @@ SUMMARY_PROMPT = os.getenv("SUMMARY_PROMPT", """Проанализируй тр
 Транскрипт:
 """)
 
+CHUNK_PROMPT = os.getenv("CHUNK_PROMPT", """Кратко перескажи фрагмент транскрипта встречи. Сохрани решения, задачи и ответственных, цифры и открытые вопросы.
+
+Фрагмент:
+""")
+
+QA_CHUNK_PROMPT = os.getenv("QA_CHUNK_PROMPT", """Выпиши из фрагмента транскрипта всё, что относится к вопросу «{question}», с метками времени. Если ничего не относится, ответь «—».
+
+Фрагмент:
+""")
+
 # Track last activity for GPU services
 last_activity = {"asr-worker": 0, "llm": 0}
-gpu_services_running = {"asr-worker": False, "llm": False}
+# Calls still using each service; the idle checker never stops a busy one
+in_flight = {"asr-worker": 0, "llm": 0}
+idle_policies = {
+    name: AdaptiveIdlePolicy(IDLE_TIMEOUT, IDLE_TIMEOUT_MIN, IDLE_TIMEOUT_MAX, lookahead=PRESTART_LOOKAHEAD)
+    for name in last_activity
+}
+
+# Keep-alive client for asr-api and llm, created in lifespan
+http_client: httpx.AsyncClient | None = None
 
+# GPU container controllers, created in lifespan
+docker: DockerClient | None = None
+services: dict[str, ServiceController] = {}
+background_tasks: set[asyncio.Task] = set()
 
-def docker_compose(*args):
-    cmd = ["docker", "compose", "-p", COMPOSE_PROJECT] + list(args)
-    subprocess.run(cmd, capture_output=True)
 
+async def llm_ready() -> bool:
+    resp = await http_client.get(f"{LLM_URL}/health", timeout=2)
+    return resp.status_code == 200
 
-def start_service(name: str):
-    if not gpu_services_running.get(name):
-        print(f"Starting {name}...")
-        docker_compose("start", name)
-        gpu_services_running[name] = True
 
+async def asr_worker_ready() -> bool:
+    """A worker that finished loading after our start request.
 
-def stop_service(name: str):
-    if gpu_services_running.get(name):
-        print(f"Stopping {name} (idle)...")
-        docker_compose("stop", name)
-        gpu_services_running[name] = False
+    Heartbeats outlive their worker until they expire, so one from before
+    the start may belong to a container that is already gone. If the start
+    found the container running, any ready worker counts.
+    """
+    resp = await http_client.get(f"{ASR_URL}/v1/workers", timeout=2)
+    started_at = services["asr-worker"].started_at
+    return any(w["state"] == "ready" and w.get("since", 0) >= started_at for w in resp.json()["workers"])
 
 
-async def wait_for_service(url: str, timeout: float = 120):
-    """Wait for service to be ready"""
-    start = time.time()
-    async with httpx.AsyncClient() as client:
-        while time.time() - start < timeout:
-            try:
-                resp = await client.get(f"{url}/health", timeout=2)
-                if resp.status_code == 200:
-                    return True
-            except Exception:
-                pass
-            await asyncio.sleep(1)
-    return False
+def start_in_background(name: str):
+    """Start a service without waiting for it; jobs stay queued until it is ready."""
+    def log_failure(task: asyncio.Task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"{name} failed to start: {task.exception()}")
+
+    task = asyncio.create_task(services[name].start())
+    background_tasks.add(task)  # the loop only keeps weak references to tasks
+    task.add_done_callback(log_failure)
 
 
 async def ensure_asr_worker():
-    start_service("asr-worker")
     last_activity["asr-worker"] = time.time()
+    idle_policies["asr-worker"].record()
+    start_in_background("asr-worker")
 
 
 async def ensure_llm():
-    start_service("llm")
     last_activity["llm"] = time.time()
-    # Wait for LLM to be ready
-    ready = await wait_for_service(LLM_URL, timeout=180)
-    if not ready:
-        raise HTTPException(status_code=503, detail="LLM failed to start")
+    idle_policies["llm"].record()
+    try:
+        await services["llm"].start()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"LLM failed to start: {e}")
 
 
 async def has_pending_jobs() -> bool:
     """Check if there are pending/processing jobs"""
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(f"{ASR_URL}/v1/jobs")
-            jobs = resp.json()
-            return any(j["status"] in ("pending", "processing") for j in jobs)
+        resp = await http_client.get(f"{ASR_URL}/v1/jobs/count", params={"status": "pending,processing"}, timeout=5)
+        return resp.json()["count"] > 0
     except Exception:
         return False
 
@@ -103,43 +142,85 @@ async def idle_checker():
         await asyncio.sleep(60)
         now = time.time()
 
-        # Check asr-worker
-        if gpu_services_running.get("asr-worker"):
-            last = last_activity.get("asr-worker", 0)
-            if last > 0 and (now - last) > IDLE_TIMEOUT:
-                if not await has_pending_jobs():
-                    stop_service("asr-worker")
-
-        # Check llm
-        if gpu_services_running.get("llm"):
-            last = last_activity.get("llm", 0)
-            if last > 0 and (now - last) > IDLE_TIMEOUT:
-                stop_service("llm")
+        for name, controller in services.items():
+            policy = idle_policies[name]
+            if controller.state in (ServiceState.ready, ServiceState.unhealthy):
+                last = last_activity.get(name, 0)
+                timeout = policy.idle_timeout(now) if ADAPTIVE_IDLE else IDLE_TIMEOUT
+                if not in_flight[name] and last > 0 and (now - last) > timeout:
+                    # Queued jobs wait for a ready worker; an unhealthy one won't get to them
+                    if name == "asr-worker" and controller.state == ServiceState.ready and await has_pending_jobs():
+                        continue
+                    try:
+                        await controller.stop()
+                    except Exception as e:
+                        print(f"Could not stop {name}: {e}")
+            elif controller.state == ServiceState.stopped and ADAPTIVE_IDLE and policy.should_prestart(now):
+                print(f"Pre-starting {name} ahead of expected traffic")
+                policy.prestarted(now)
+                last_activity[name] = now
+                start_in_background(name)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Check initial state
-    result = subprocess.run(
-        ["docker", "compose", "-p", COMPOSE_PROJECT, "ps", "--format", "{{.Service}}:{{.State}}"],
-        capture_output=True, text=True
+    global http_client
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+    )
+
+    global docker
+    docker = DockerClient(DOCKER_HOST, COMPOSE_PROJECT)
+    services["asr-worker"] = ServiceController(
+        docker, "asr-worker", ready_check=asr_worker_ready, ready_timeout=ASR_WORKER_READY_TIMEOUT
     )
-    for line in result.stdout.strip().split("\n"):
-        if ":" in line:
-            svc, state = line.split(":", 1)
-            if svc in gpu_services_running:
-                gpu_services_running[svc] = "running" in state.lower()
+    services["llm"] = ServiceController(docker, "llm", ready_check=llm_ready, ready_timeout=180)
+
+    # Check initial state
+    for controller in services.values():
+        try:
+            await controller.sync()
+        except Exception as e:
+            print(f"Could not read state of {controller.name}: {e}")
 
     # Start idle checker
     task = asyncio.create_task(idle_checker())
     yield
     task.cancel()
+    await docker.aclose()
+    await http_client.aclose()
 
 
 app = FastAPI(title="Gateway", lifespan=lifespan)
 static_dir = Path(__file__).parent / "static"
 
 
+async def llm_complete(messages: list[dict], max_tokens: int) -> str:
+    payload = {
+        "model": "local",
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": LLM_TEMPERATURE
+    }
+    in_flight["llm"] += 1
+    try:
+        resp = await http_client.post(f"{LLM_URL}/v1/chat/completions", json=payload, timeout=LLM_TIMEOUT)
+        data = resp.json()
+        return data["choices"][0]["message"]["content"]
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"LLM unavailable: {e}")
+    finally:
+        in_flight["llm"] -= 1
+        # Idle time counts from the end of the last call, not from when the request came in
+        last_activity["llm"] = time.time()
+
+
+summarizer = ChunkSummarizer(
+    llm_complete, SUMMARY_CHUNK_TOKENS, SUMMARY_CHARS_PER_TOKEN,
+    SUMMARY_MAP_CONCURRENCY, SUMMARY_MAP_MAX_TOKENS, SUMMARY_CACHE_SIZE
+)
+
+
 class ChatRequest(BaseModel):
     messages: list[dict]
     max_tokens: int = 2000
@@ -148,12 +229,14 @@ class ChatRequest(BaseModel):
 class SummarizeRequest(BaseModel):
     text: str
     prompt: str | None = None
+    segments: list[dict] | None = None  # transcript segments; long texts are split on their boundaries
 
 
 class QARequest(BaseModel):
     text: str
     question: str
     summary: str | None = None
+    segments: list[dict] | None = None
 
 
 @app.get("/")
@@ -162,19 +245,40 @@ async def index():
 
 
 @app.post("/api/transcribe")
-async def transcribe(file: UploadFile = File(...)):
+async def transcribe(request: Request):
+    """Forward the multipart upload to asr-api as a stream, without parsing or buffering it."""
     await ensure_asr_worker()
-    async with httpx.AsyncClient(timeout=ASR_TIMEOUT) as client:
-        files = {"file": (file.filename, await file.read(), file.content_type)}
-        resp = await client.post(f"{ASR_URL}/v1/transcribe", files=files)
-        return resp.json()
+    headers = {k: v for k, v in request.headers.items() if k in ("content-type", "content-length")}
+    resp = await http_client.post(
+        f"{ASR_URL}/v1/transcribe", content=request.stream(), headers=headers,
+        params=request.query_params, timeout=ASR_TIMEOUT
+    )
+    return JSONResponse(resp.json(), status_code=resp.status_code)
+
+
+@app.post("/api/transcribe/bulk")
+async def transcribe_bulk(request: Request):
+    await ensure_asr_worker()
+    headers = {k: v for k, v in request.headers.items() if k in ("content-type", "content-length")}
+    resp = await http_client.post(
+        f"{ASR_URL}/v1/transcribe/bulk", content=request.stream(), headers=headers,
+        params=request.query_params, timeout=ASR_TIMEOUT
+    )
+    return JSONResponse(resp.json(), status_code=resp.status_code)
+
+
+@app.post("/api/jobs/bulk")
+async def get_jobs_bulk(request: Request):
+    resp = await http_client.post(f"{ASR_URL}/v1/jobs/bulk", content=await request.body(),
+                                  headers={"content-type": "application/json"}, timeout=30)
+    return JSONResponse(resp.json(), status_code=resp.status_code)
 
 
 @app.get("/api/jobs")
-async def list_jobs():
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.get(f"{ASR_URL}/v1/jobs")
-        return resp.json()
+async def list_jobs(request: Request):
+    resp = await http_client.get(f"{ASR_URL}/v1/jobs", params=request.query_params, timeout=10)
+    headers = {"X-Next-Cursor": resp.headers["X-Next-Cursor"]} if "X-Next-Cursor" in resp.headers else None
+    return JSONResponse(resp.json(), headers=headers)
 
 
 @app.get("/api/jobs/stream")
@@ -182,10 +286,9 @@ async def stream_jobs():
     from starlette.responses import StreamingResponse
 
     async def proxy_stream():
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("GET", f"{ASR_URL}/v1/jobs/stream") as resp:
-                async for chunk in resp.aiter_bytes():
-                    yield chunk
+        async with http_client.stream("GET", f"{ASR_URL}/v1/jobs/stream", timeout=None) as resp:
+            async for chunk in resp.aiter_bytes():
+                yield chunk
 
     return StreamingResponse(
         proxy_stream(),
@@ -196,83 +299,130 @@ async def stream_jobs():
 
 @app.get("/api/jobs/{job_id}")
 async def get_job(job_id: str):
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.get(f"{ASR_URL}/v1/jobs/{job_id}")
-        if resp.status_code == 404:
-            raise HTTPException(status_code=404, detail="Job not found")
-        return resp.json()
+    resp = await http_client.get(f"{ASR_URL}/v1/jobs/{job_id}", timeout=10)
+    if resp.status_code == 404:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return resp.json()
+
+
+@app.get("/api/jobs/{job_id}/segments")
+async def get_job_segments(job_id: str, request: Request):
+    resp = await http_client.get(f"{ASR_URL}/v1/jobs/{job_id}/segments", params=request.query_params, timeout=10)
+    if resp.status_code == 404:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return resp.json()
+
+
+@app.get("/api/jobs/{job_id}/words")
+async def get_job_words(job_id: str, request: Request):
+    resp = await http_client.get(f"{ASR_URL}/v1/jobs/{job_id}/words", params=request.query_params, timeout=10)
+    if resp.status_code == 404:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return resp.json()
+
+
+@app.get("/api/jobs/{job_id}/meta")
+async def get_job_meta(job_id: str):
+    resp = await http_client.get(f"{ASR_URL}/v1/jobs/{job_id}/meta", timeout=10)
+    if resp.status_code == 404:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return resp.json()
+
+
+@app.get("/api/jobs/{job_id}/text")
+async def get_job_text(job_id: str):
+    resp = await http_client.get(f"{ASR_URL}/v1/jobs/{job_id}/text", timeout=10)
+    if resp.status_code == 404:
+        raise HTTPException(status_code=404, detail="No transcript for this job")
+    return resp.json()
 
 
 @app.delete("/api/jobs/{job_id}")
 async def delete_job(job_id: str):
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.delete(f"{ASR_URL}/v1/jobs/{job_id}")
-        return resp.json()
+    resp = await http_client.delete(f"{ASR_URL}/v1/jobs/{job_id}", timeout=10)
+    return resp.json()
+
+
+@app.websocket("/api/stream")
+async def stream(ws: WebSocket):
+    """Relay a live transcription session to the worker, starting it first if needed."""
+    await ws.accept()
+    last_activity["asr-worker"] = time.time()
+    idle_policies["asr-worker"].record()
+    try:
+        await services["asr-worker"].start()
+    except Exception as e:
+        await ws.close(code=1013, reason=f"ASR worker failed to start: {e}"[:120])
+        return
+
+    async def client_to_worker(upstream):
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            # A live session is activity: keep the idle checker away from the worker
+            last_activity["asr-worker"] = time.time()
+            await upstream.send(message["bytes"] if message.get("bytes") is not None else message.get("text", ""))
+
+    async def worker_to_client(upstream):
+        async for message in upstream:
+            if isinstance(message, str):
+                await ws.send_text(message)
+            else:
+                await ws.send_bytes(message)
+        await ws.close()
+
+    in_flight["asr-worker"] += 1
+    try:
+        async with websockets.connect(f"{ASR_STREAM_URL}/v1/stream", max_size=None) as upstream:
+            tasks = [
+                asyncio.create_task(client_to_worker(upstream)),
+                asyncio.create_task(worker_to_client(upstream)),
+            ]
+            _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+    except (OSError, websockets.WebSocketException) as e:
+        print(f"Stream relay ended: {e}")
+    finally:
+        in_flight["asr-worker"] -= 1
 
 
 @app.post("/api/chat")
 async def chat(req: ChatRequest):
     await ensure_llm()
-    async with httpx.AsyncClient(timeout=LLM_TIMEOUT) as client:
-        payload = {
-            "model": "local",
-            "messages": req.messages,
-            "max_tokens": req.max_tokens,
-            "temperature": LLM_TEMPERATURE
-        }
-        try:
-            resp = await client.post(f"{LLM_URL}/v1/chat/completions", json=payload)
-            data = resp.json()
-            return {"text": data["choices"][0]["message"]["content"]}
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"LLM unavailable: {e}")
+    return {"text": await llm_complete(req.messages, req.max_tokens)}
 
 
 @app.post("/api/summarize")
 async def summarize(req: SummarizeRequest):
+    """Transcripts over one chunk are summarized per chunk first; only the final step uses `prompt`."""
     await ensure_llm()
     prompt = req.prompt or SUMMARY_PROMPT
-    messages = [{"role": "user", "content": prompt + req.text}]
-
-    async with httpx.AsyncClient(timeout=LLM_TIMEOUT) as client:
-        payload = {
-            "model": "local",
-            "messages": messages,
-            "max_tokens": LLM_MAX_TOKENS,
-            "temperature": LLM_TEMPERATURE
-        }
-        try:
-            resp = await client.post(f"{LLM_URL}/v1/chat/completions", json=payload)
-            data = resp.json()
-            return {"summary": data["choices"][0]["message"]["content"]}
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"LLM unavailable: {e}")
+    text = req.text
+    if not summarizer.fits(text):
+        text = await summarizer.condense(CHUNK_PROMPT, req.segments or split_sentences(req.text))
+    messages = [{"role": "user", "content": prompt + text}]
+    return {"summary": await llm_complete(messages, LLM_MAX_TOKENS)}
 
 
 @app.post("/api/qa")
 async def question_answer(req: QARequest):
     await ensure_llm()
-    context = f"Транскрипт:\n{req.text}"
+    if summarizer.fits(req.text):
+        context = f"Транскрипт:\n{req.text}"
+    else:
+        # Too long for one prompt: answer from per-chunk excerpts relevant to the question
+        prompt = QA_CHUNK_PROMPT.replace("{question}", req.question)
+        excerpts = await summarizer.condense(prompt, req.segments or split_sentences(req.text))
+        context = f"Выдержки из транскрипта:\n{excerpts}"
     if req.summary:
         context += f"\n\nSummary:\n{req.summary}"
     messages = [
         {"role": "system", "content": f"Ответь на вопрос пользователя, основываясь на следующем контексте:\n\n{context}"},
         {"role": "user", "content": req.question}
     ]
-
-    async with httpx.AsyncClient(timeout=LLM_TIMEOUT) as client:
-        payload = {
-            "model": "local",
-            "messages": messages,
-            "max_tokens": LLM_MAX_TOKENS,
-            "temperature": LLM_TEMPERATURE
-        }
-        try:
-            resp = await client.post(f"{LLM_URL}/v1/chat/completions", json=payload)
-            data = resp.json()
-            return {"answer": data["choices"][0]["message"]["content"]}
-        except Exception as e:
-            raise HTTPException(status_code=503, detail=f"LLM unavailable: {e}")
+    return {"answer": await llm_complete(messages, LLM_MAX_TOKENS)}
 
 
 @app.get("/health")
@@ -282,8 +432,19 @@ async def health():
 
 @app.get("/api/gpu-status")
 async def gpu_status():
+    now = time.time()
+    try:
+        resp = await http_client.get(f"{ASR_URL}/v1/workers", timeout=2)
+        asr_workers = resp.json()
+    except Exception:
+        asr_workers = None
     return {
-        "services": gpu_services_running,
-        "last_activity": {k: int(time.time() - v) if v > 0 else None for k, v in last_activity.items()},
-        "idle_timeout": IDLE_TIMEOUT
+        "services": {name: c.state == ServiceState.ready for name, c in services.items()},
+        "states": {name: c.state.value for name, c in services.items()},
+        "asr_workers": asr_workers,
+        "last_activity": {k: int(now - v) if v > 0 else None for k, v in last_activity.items()},
+        "idle_timeout": {
+            name: int(policy.idle_timeout(now)) if ADAPTIVE_IDLE else IDLE_TIMEOUT
+            for name, policy in idle_policies.items()
+        }
     }
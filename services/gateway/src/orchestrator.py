@@ -0,0 +1,149 @@
+import json
+import asyncio
+import time
+from enum import Enum
+from typing import Awaitable, Callable
+
+import httpx
+
+
+class ServiceState(str, Enum):
+    stopped = "stopped"
+    starting = "starting"
+    ready = "ready"
+    stopping = "stopping"
+    unhealthy = "unhealthy"  # running, but never reported ready
+
+
+class DockerClient:
+    """Minimal async Docker Engine API client scoped to one compose project.
+
+    `host` is a unix:// socket or an http(s):// / tcp:// URL, so a fake
+    endpoint (or an httpx.MockTransport via `transport`) can stand in for Docker.
+    """
+
+    def __init__(self, host: str, project: str, transport: httpx.AsyncBaseTransport | None = None):
+        self.project = project
+        if host.startswith("unix://"):
+            transport = transport or httpx.AsyncHTTPTransport(uds=host[len("unix://"):])
+            base_url = "http://docker"
+        else:
+            base_url = host.replace("tcp://", "http://", 1)
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=30)
+
+    async def _container(self, service: str) -> dict | None:
+        labels = [f"com.docker.compose.project={self.project}", f"com.docker.compose.service={service}"]
+        resp = await self.client.get("/containers/json", params={"all": "true", "filters": json.dumps({"label": labels})})
+        resp.raise_for_status()
+        containers = resp.json()
+        return containers[0] if containers else None
+
+    async def state(self, service: str) -> str | None:
+        """Docker state ("running", "exited", ...) or None if the container doesn't exist."""
+        container = await self._container(service)
+        return container["State"] if container else None
+
+    async def start(self, service: str) -> bool:
+        """Start the container; False if it was already running."""
+        container = await self._container(service)
+        if container is None:
+            raise RuntimeError(f"No container for service {service}; run docker compose up first")
+        resp = await self.client.post(f"/containers/{container['Id']}/start")
+        if resp.status_code not in (204, 304):  # 304: already running
+            resp.raise_for_status()
+        return resp.status_code == 204
+
+    async def stop(self, service: str, timeout: int = 10):
+        container = await self._container(service)
+        if container is None:
+            return
+        resp = await self.client.post(f"/containers/{container['Id']}/stop", params={"t": timeout}, timeout=timeout + 30)
+        if resp.status_code not in (204, 304):  # 304: already stopped
+            resp.raise_for_status()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ServiceController:
+    """State machine for one on-demand container: stopped → starting → ready → stopping → stopped.
+
+    Concurrent start() calls share a single in-flight start, and start/stop
+    transitions never overlap. A container that starts but never passes the
+    ready check is left unhealthy: running, so it can still be stopped.
+    """
+
+    def __init__(
+        self,
+        docker: DockerClient,
+        name: str,
+        ready_check: Callable[[], Awaitable[bool]] | None = None,
+        ready_timeout: float = 180
+    ):
+        self.docker = docker
+        self.name = name
+        self.ready_check = ready_check
+        self.ready_timeout = ready_timeout
+        self.state = ServiceState.stopped
+        self.started_at = 0.0  # wall clock of the last start request, 0 if it found the container running
+        self._start_task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    async def sync(self):
+        """Pick up the container's real state, e.g. after a gateway restart."""
+        running = await self.docker.state(self.name) == "running"
+        self.state = ServiceState.ready if running else ServiceState.stopped
+
+    async def start(self):
+        if self.state == ServiceState.ready:
+            return
+        if self._start_task is None or self._start_task.done():
+            self._start_task = asyncio.create_task(self._start())
+        # Shield: one caller disconnecting must not cancel the start for everyone else
+        await asyncio.shield(self._start_task)
+
+    async def _start(self):
+        async with self._lock:
+            if self.state == ServiceState.ready:
+                return
+            print(f"Starting {self.name}...")
+            previous, self.state = self.state, ServiceState.starting
+            self.started_at = time.time()
+            try:
+                if not await self.docker.start(self.name):
+                    self.started_at = 0.0  # no fresh ready signal will come from what is already up
+            except BaseException:
+                self.state = previous
+                raise
+            try:
+                if self.ready_check and not await self._wait_ready():
+                    raise RuntimeError(f"{self.name} not ready after {self.ready_timeout}s")
+            except BaseException:
+                self.state = ServiceState.unhealthy
+                raise
+            self.state = ServiceState.ready
+
+    async def _wait_ready(self) -> bool:
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            try:
+                if await self.ready_check():
+                    return True
+            except Exception:
+                pass
+            await asyncio.sleep(1)
+        return False
+
+    async def stop(self):
+        async with self._lock:
+            if self.state == ServiceState.stopped:
+                return
+            print(f"Stopping {self.name} (idle)...")
+            previous, self.state = self.state, ServiceState.stopping
+            try:
+                await self.docker.stop(self.name)
+            except BaseException:
+                # The container may well still be running; don't start it again on top
+                self.state = previous
+                raise
+            self.state = ServiceState.stopped
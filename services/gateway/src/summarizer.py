@@ -0,0 +1,114 @@
+import re
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+Complete = Callable[[list[dict], int], Awaitable[str]]
+
+
+def split_sentences(text: str) -> list[dict]:
+    """Stand-in segments for a transcript that came without them."""
+    return [{"text": s} for s in re.split(r"(?<=[.!?…])\s+", text.strip()) if s]
+
+
+def format_segment(segment: dict) -> str:
+    if segment.get("start") is None:
+        return segment["text"]
+    minutes, seconds = divmod(int(segment["start"]), 60)
+    return f"[{minutes:02d}:{seconds:02d}] {segment['text']}"
+
+
+class ChunkSummarizer:
+    """Map-reduce over transcripts that don't fit one LLM context slot.
+
+    The transcript is split on segment boundaries into chunks of at most
+    `chunk_tokens`, the chunks are summarized concurrently, then the partial
+    summaries are combined. Partial summaries are cached by chunk text and
+    map prompt, so changing the final prompt only reruns the reduce step.
+    """
+
+    max_rounds = 4  # re-map rounds before giving up on fitting one chunk
+
+    def __init__(self, complete: Complete, chunk_tokens: int, chars_per_token: float,
+                 concurrency: int, map_max_tokens: int, cache_size: int):
+        # Every re-map round must be able to pack at least two summaries into a chunk
+        if map_max_tokens * 2 > chunk_tokens:
+            raise ValueError(f"map_max_tokens ({map_max_tokens}) must be at most half of chunk_tokens ({chunk_tokens})")
+        self.complete = complete
+        self.chunk_tokens = chunk_tokens
+        self.chars_per_token = chars_per_token
+        self.map_max_tokens = map_max_tokens
+        self.cache_size = cache_size
+        self.cache: OrderedDict[str, str] = OrderedDict()
+        self.slots = asyncio.Semaphore(concurrency)
+
+    def tokens(self, text: str) -> int:
+        # Rough estimate; the budget leaves room for prompt and answer
+        return int(len(text) / self.chars_per_token) + 1
+
+    def fits(self, text: str) -> bool:
+        return self.tokens(text) <= self.chunk_tokens
+
+    def wrap(self, line: str) -> list[str]:
+        """Cut a line over budget into pieces that fit, at whitespace where there is any.
+
+        Unpunctuated transcripts without segments arrive as one line.
+        """
+        limit = int((self.chunk_tokens - 1) * self.chars_per_token)
+        pieces = []
+        while not self.fits(line):
+            cut = line.rfind(" ", 0, limit + 1)
+            if cut <= 0:
+                cut = limit
+            pieces.append(line[:cut].rstrip())
+            line = line[cut:].lstrip()
+        return pieces + [line] if line else pieces
+
+    def split(self, lines: list[str]) -> list[str]:
+        """Greedy grouping of consecutive lines, each wrapped to fit one chunk."""
+        chunks, current, size = [], [], 0
+        for line in (piece for line in lines for piece in self.wrap(line)):
+            tokens = self.tokens(line)
+            if current and size + tokens > self.chunk_tokens:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    async def _map_one(self, prompt: str, chunk: str) -> str:
+        key = hashlib.sha256(f"{self.map_max_tokens}\0{prompt}\0{chunk}".encode()).hexdigest()
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        async with self.slots:
+            summary = await self.complete([{"role": "user", "content": prompt + chunk}], self.map_max_tokens)
+        self.cache[key] = summary
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return summary
+
+    async def map(self, prompt: str, chunks: list[str]) -> list[str]:
+        return list(await asyncio.gather(*(self._map_one(prompt, chunk) for chunk in chunks)))
+
+    async def condense(self, prompt: str, segments: list[dict]) -> str:
+        """Map the transcript to partial summaries, re-mapping them until they fit one chunk.
+
+        Stops early once a round no longer reduces the number of parts, e.g. when
+        the model ignores the length limit; the result may then exceed one chunk.
+        """
+        parts = await self.map(prompt, self.split([format_segment(s) for s in segments]))
+        combined = "\n\n".join(f"Часть {i + 1}:\n{part}" for i, part in enumerate(parts))
+        for _ in range(self.max_rounds):
+            if self.fits(combined) or len(parts) < 2:
+                break
+            chunks = self.split(parts)
+            if len(chunks) >= len(parts):
+                break
+            parts = await self.map(prompt, chunks)
+            combined = "\n\n".join(f"Часть {i + 1}:\n{part}" for i, part in enumerate(parts))
+        return combined
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the gateway as `src`, like `uvicorn src.main:app` does from services/gateway
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,30 @@
+from src.idle_policy import DAY, AdaptiveIdlePolicy
+
+
+def policy_with_history() -> tuple[AdaptiveIdlePolicy, float]:
+    """Two days of one request a day at the same time; `now` is just before the third."""
+    policy = AdaptiveIdlePolicy(120, 60, 900, lookahead=600)
+    now = 10 * DAY
+    for day in (2, 1):
+        policy.record(now - day * DAY + 300)
+    return policy, now
+
+
+def test_prestarts_ahead_of_daily_traffic():
+    policy, now = policy_with_history()
+    assert policy.should_prestart(now)
+
+
+def test_prestarts_once_per_window():
+    policy, now = policy_with_history()
+    policy.prestarted(now)
+    # Stopped again by the idle timeout before anyone came: no restart within the window
+    assert not policy.should_prestart(now + 180)
+    assert not policy.should_prestart(now + 540)
+
+
+def test_real_arrival_rearms_prestart():
+    policy, now = policy_with_history()
+    policy.prestarted(now)
+    policy.record(now + 60)
+    assert policy.should_prestart(now + 120)
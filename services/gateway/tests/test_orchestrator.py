@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from src.orchestrator import ServiceController, ServiceState
+
+
+class FakeDocker:
+    """Stands in for DockerClient; each call waits on `release` so tests can look mid-transition."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.fail = None
+        self.running = False
+
+    async def _call(self, action: str):
+        self.calls.append(action)
+        await self.release.wait()
+        if self.fail:
+            raise self.fail
+
+    async def start(self, service: str) -> bool:
+        await self._call("start")
+        started, self.running = not self.running, True
+        return started
+
+    async def stop(self, service: str, timeout: int = 10):
+        await self._call("stop")
+        self.running = False
+
+    async def state(self, service: str) -> str | None:
+        return "running" if self.running else "exited"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_starts_share_one_docker_start():
+    async def scenario():
+        docker = FakeDocker()
+        docker.release.clear()
+        controller = ServiceController(docker, "asr-worker")
+        starts = [asyncio.create_task(controller.start()) for _ in range(5)]
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert controller.state == ServiceState.starting
+        docker.release.set()
+        await asyncio.gather(*starts)
+        assert docker.calls == ["start"]
+        assert controller.state == ServiceState.ready
+
+        await controller.start()  # already ready
+        assert docker.calls == ["start"]
+
+    run(scenario())
+
+
+def test_failed_start_returns_to_stopped():
+    async def scenario():
+        docker = FakeDocker()
+        docker.fail = RuntimeError("no container")
+        controller = ServiceController(docker, "asr-worker")
+        results = await asyncio.gather(controller.start(), controller.start(), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert docker.calls == ["start"]
+        assert controller.state == ServiceState.stopped
+
+        docker.fail = None
+        await controller.start()  # a later start tries again
+        assert docker.calls == ["start", "start"]
+        assert controller.state == ServiceState.ready
+
+    run(scenario())
+
+
+def test_never_ready_is_left_stoppable():
+    async def scenario():
+        async def not_ready():
+            return False
+
+        docker = FakeDocker()
+        controller = ServiceController(docker, "asr-worker", ready_check=not_ready, ready_timeout=0)
+        with pytest.raises(RuntimeError, match="not ready"):
+            await controller.start()
+        assert controller.state == ServiceState.unhealthy
+
+        await controller.stop()
+        assert docker.calls == ["start", "stop"]
+        assert controller.state == ServiceState.stopped
+
+    run(scenario())
+
+
+def test_start_notes_container_already_running():
+    async def scenario():
+        docker = FakeDocker()
+        controller = ServiceController(docker, "asr-worker")
+        await controller.start()
+        assert controller.started_at > 0
+
+        docker.running = True
+        controller.state = ServiceState.unhealthy
+        await controller.start()
+        assert controller.started_at == 0  # ready checks accept workers from before this start
+        assert controller.state == ServiceState.ready
+
+    run(scenario())
+
+
+def test_stop_transitions():
+    async def scenario():
+        docker = FakeDocker()
+        controller = ServiceController(docker, "asr-worker")
+        await controller.start()
+
+        docker.release.clear()
+        stop = asyncio.create_task(controller.stop())
+        await asyncio.sleep(0)
+        assert controller.state == ServiceState.stopping
+        docker.release.set()
+        await stop
+        assert controller.state == ServiceState.stopped
+
+        await controller.stop()  # already stopped
+        assert docker.calls == ["start", "stop"]
+
+    run(scenario())
+
+
+def test_failed_stop_restores_previous_state():
+    async def scenario():
+        docker = FakeDocker()
+        controller = ServiceController(docker, "asr-worker")
+        await controller.start()
+
+        docker.fail = RuntimeError("docker unavailable")
+        with pytest.raises(RuntimeError):
+            await controller.stop()
+        assert controller.state == ServiceState.ready
+
+    run(scenario())
+
+
+def test_stop_waits_for_inflight_start():
+    async def scenario():
+        docker = FakeDocker()
+        docker.release.clear()
+        controller = ServiceController(docker, "asr-worker")
+        start = asyncio.create_task(controller.start())
+        await asyncio.sleep(0)
+        stop = asyncio.create_task(controller.stop())
+        await asyncio.sleep(0)
+        assert docker.calls == ["start"]  # stop holds off until the start settles
+
+        docker.release.set()
+        await asyncio.gather(start, stop)
+        assert docker.calls == ["start", "stop"]
+        assert controller.state == ServiceState.stopped
+
+    run(scenario())
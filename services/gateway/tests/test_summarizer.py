@@ -0,0 +1,39 @@
+import asyncio
+
+from src.summarizer import ChunkSummarizer, split_sentences
+
+
+def summarizer(complete=None, chunk_tokens: int = 100, map_max_tokens: int = 20) -> ChunkSummarizer:
+    async def echo_start(messages, max_tokens):
+        return messages[0]["content"][:max_tokens]
+
+    return ChunkSummarizer(complete or echo_start, chunk_tokens, 3.0, 2, map_max_tokens, 100)
+
+
+def test_split_wraps_unpunctuated_text():
+    s = summarizer()
+    text = " ".join(f"слово{i}" for i in range(2000))  # no sentence ends, one "sentence"
+    chunks = s.split([seg["text"] for seg in split_sentences(text)])
+    assert len(chunks) > 1
+    assert all(s.fits(chunk) for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_wrap_cuts_text_without_spaces():
+    s = summarizer()
+    pieces = s.wrap("x" * 1000)
+    assert all(s.fits(piece) for piece in pieces)
+    assert "".join(pieces) == "x" * 1000
+
+
+def test_condense_stops_when_summaries_do_not_shrink():
+    calls = []
+
+    async def verbose(messages, max_tokens):
+        calls.append(messages)
+        return "y " * 200  # ignores the length limit
+
+    s = summarizer(verbose)
+    result = asyncio.run(s.condense("", [{"text": f"{i} " * 100} for i in range(10)]))
+    assert result
+    assert len(calls) < 50